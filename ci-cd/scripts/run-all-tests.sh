@@ -35,9 +35,10 @@ source venv/bin/activate
 echo -e "${YELLOW}Installing dependencies...${NC}"
 pip install -q -r services/user-service/requirements.txt
 pip install -q pytest pytest-cov pytest-html selenium robotframework robotframework-seleniumlibrary
+pip install -q -r tests/performance/requirements.txt
 
 # Create reports directory
-mkdir -p reports/{unit,integration,e2e,robot,coverage}
+mkdir -p reports/{unit,integration,e2e,robot,coverage,performance}
 
 echo ""
 echo "======================================"
@@ -102,6 +103,25 @@ else
     ROBOT_RESULT=0
 fi
 
+echo ""
+echo "======================================"
+echo "  Running Performance Tests"
+echo "======================================"
+if docker-compose ps | grep user-service | grep -q "Up"; then
+    python tests/performance/run_load_test.py \
+        --users 50 \
+        --spawn-rate 5 \
+        --run-time 2m \
+        --host http://localhost:5000 \
+        --output-dir reports/performance \
+        UserServiceUser
+    PERFORMANCE_RESULT=$?
+    print_status $PERFORMANCE_RESULT "Performance Tests"
+else
+    echo -e "${YELLOW}⚠ User service not running. Skipping performance tests.${NC}"
+    PERFORMANCE_RESULT=0
+fi
+
 echo ""
 echo "======================================"
 echo "  Test Summary"
@@ -110,6 +130,7 @@ print_status $UNIT_RESULT "Unit Tests"
 print_status $INTEGRATION_RESULT "Integration Tests"
 print_status $E2E_RESULT "E2E Selenium Tests"
 print_status $ROBOT_RESULT "Robot Framework Tests"
+print_status $PERFORMANCE_RESULT "Performance Tests"
 
 echo ""
 echo "======================================"
@@ -118,10 +139,11 @@ echo "======================================"
 echo "Unit Test Coverage: reports/coverage/index.html"
 echo "E2E Test Report: reports/e2e/report.html"
 echo "Robot Framework: reports/robot/report.html"
+echo "Performance: reports/performance/run.html, reports/performance/run_report.json"
 echo ""
 
 # Calculate overall result
-OVERALL_RESULT=$((UNIT_RESULT + INTEGRATION_RESULT + E2E_RESULT + ROBOT_RESULT))
+OVERALL_RESULT=$((UNIT_RESULT + INTEGRATION_RESULT + E2E_RESULT + ROBOT_RESULT + PERFORMANCE_RESULT))
 
 if [ $OVERALL_RESULT -eq 0 ]; then
     echo -e "${GREEN}✓ All tests passed!${NC}"
@@ -0,0 +1,65 @@
+#!/bin/bash
+
+# Runs the in-process user-service microbenchmarks.
+#   run-benchmarks.sh save      - record a new JSON baseline
+#   run-benchmarks.sh compare   - compare against the latest baseline and fail
+#                                 when any benchmark's mean regresses past
+#                                 BENCHMARK_THRESHOLD percent (default 10)
+# DATABASE_URL selects the backend (default: in-memory SQLite). Point it at a
+# dedicated local Postgres database to benchmark Postgres.
+
+# Color codes for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m' # No Color
+
+MODE=${1:-compare}
+THRESHOLD=${BENCHMARK_THRESHOLD:-10}
+STORAGE=tests/benchmark/baselines
+
+export DATABASE_URL=${DATABASE_URL:-sqlite:///:memory:}
+export PYTHONPATH=services/user-service${PYTHONPATH:+:$PYTHONPATH}
+
+# Name baselines after the backend so SQLite and Postgres runs never compare
+BACKEND=${DATABASE_URL%%:*}
+
+echo "======================================"
+echo "  User Service Microbenchmarks"
+echo "  Mode: $MODE  Backend: $BACKEND"
+echo "======================================"
+
+case "$MODE" in
+    save)
+        pytest tests/benchmark/ \
+            --benchmark-only \
+            --benchmark-storage="$STORAGE" \
+            --benchmark-save="$BACKEND"
+        RESULT=$?
+        ;;
+    compare)
+        LATEST=$(ls "$STORAGE"/*/*_"$BACKEND".json 2>/dev/null | sort | tail -n 1)
+        if [ -z "$LATEST" ]; then
+            echo -e "${YELLOW}⚠ No $BACKEND baseline in $STORAGE. Run '$0 save' first.${NC}"
+            exit 1
+        fi
+        BASELINE_ID=$(basename "$LATEST" | cut -d_ -f1)
+        pytest tests/benchmark/ \
+            --benchmark-only \
+            --benchmark-storage="$STORAGE" \
+            --benchmark-compare="$BASELINE_ID" \
+            --benchmark-compare-fail="mean:${THRESHOLD}%"
+        RESULT=$?
+        ;;
+    *)
+        echo "Usage: $0 [save|compare]"
+        exit 2
+        ;;
+esac
+
+if [ $RESULT -eq 0 ]; then
+    echo -e "${GREEN}✓ Benchmarks $MODE passed${NC}"
+else
+    echo -e "${RED}✗ Benchmarks $MODE failed${NC}"
+fi
+exit $RESULT
@@ -0,0 +1,52 @@
+"""
+Archival of long-deactivated users
+
+``delete_user`` only sets ``is_active = False``. Users deactivated longer
+than the retention period are moved from ``users`` to ``users_archive`` by
+``flask users archive`` (run it from cron or a Kubernetes CronJob). Rows move
+in batches, each in its own short transaction (INSERT ... SELECT, then
+DELETE), so the job never holds locks across the whole table; on Postgres the
+batch is claimed with FOR UPDATE SKIP LOCKED so it does not wait on, or
+block, requests touching the same users.
+
+Users deactivated before ``deactivated_at`` was tracked (NULL) are eligible
+immediately.
+"""
+import datetime
+
+from sqlalchemy import delete, insert, literal, or_, select
+
+
+def archive_inactive_users(session, user_model, archive_model, retention_days,
+                           batch_size=500, now=None, on_batch=None):
+    """Move users deactivated more than ``retention_days`` ago; return how many moved"""
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=retention_days)
+    users = user_model.__table__
+    columns = [column.name for column in users.columns]
+
+    eligible = (
+        select(users.c.id)
+        .where(users.c.is_active.is_(False))
+        .where(or_(users.c.deactivated_at.is_(None), users.c.deactivated_at < cutoff))
+        .order_by(users.c.id)
+        .limit(batch_size)
+    )
+    if session.get_bind().dialect.name == 'postgresql':
+        eligible = eligible.with_for_update(skip_locked=True)
+
+    moved = 0
+    while True:
+        ids = session.execute(eligible).scalars().all()
+        if not ids:
+            session.rollback()
+            return moved
+        session.execute(insert(archive_model.__table__).from_select(
+            columns + ['archived_at'],
+            select(*[users.c[name] for name in columns], literal(now)).where(users.c.id.in_(ids))
+        ))
+        session.execute(delete(users).where(users.c.id.in_(ids)))
+        session.commit()
+        moved += len(ids)
+        if on_batch is not None:
+            on_batch(ids)
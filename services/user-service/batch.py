@@ -0,0 +1,107 @@
+"""
+Multiplexed batch requests (``POST /api/batch``)
+
+A batch is a JSON array of sub-requests::
+
+    [{"id": "me", "method": "GET", "path": "/api/users/me"},
+     {"id": "u7", "method": "GET", "path": "/api/users/7?fields=id,username"},
+     {"method": "PUT", "path": "/api/users/1", "body": {"first_name": "Ann"}}]
+
+The batch is authenticated once; each sub-request is routed through the
+Flask URL map and dispatched in-process with the caller's user, skipping only
+the JWT decode. The request hooks run for every item as for a direct call:
+its deadline is the route's policy capped by the time left in the batch
+(passed as ``X-Request-Timeout``), the circuit breaker guards it and it gets
+its own access-log record and trace span. Runs of consecutive GETs execute
+concurrently on a shared thread pool; any other method is a barrier that runs
+alone, after everything before it, so writes keep their order. Every item
+runs in its own app context and therefore its own database session.
+
+Results come back in request order as ``{"id", "status", "body"}``. Items
+that have not started when the batch's time budget runs out are answered
+with 503 without being executed.
+"""
+import time
+
+from flask import g, request
+
+import deadlines
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def parse_items(payload, max_items, max_writes):
+    """Validate the batch body; return the normalized items or raise ValueError"""
+    if not isinstance(payload, list) or not payload:
+        raise ValueError('Batch body must be a non-empty JSON array of requests')
+    if len(payload) > max_items:
+        raise ValueError(f'A batch may contain at most {max_items} requests')
+
+    items = []
+    for index, raw in enumerate(payload):
+        if not isinstance(raw, dict):
+            raise ValueError(f'Request {index} must be an object')
+        method = str(raw.get('method', 'GET')).upper()
+        path = raw.get('path')
+        if method not in METHODS:
+            raise ValueError(f'Request {index} has an unsupported method')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError(f'Request {index} needs an absolute path')
+        items.append({'id': raw.get('id', index), 'method': method, 'path': path, 'body': raw.get('body')})
+
+    if sum(item['method'] != 'GET' for item in items) > max_writes:
+        raise ValueError(f'A batch may contain at most {max_writes} non-GET requests')
+    return items
+
+
+def dispatch(app, item, user, excluded, headers=None):
+    """Run one sub-request in a fresh request context; return ``(status, body)``"""
+    with app.test_request_context(item['path'], method=item['method'], json=item['body'], headers=headers):
+        if request.routing_exception is not None:
+            error = request.routing_exception
+            return error.code, {'message': error.description}
+        if request.url_rule.endpoint in excluded:
+            return 400, {'message': 'Endpoint is not available in a batch'}
+
+        g.batch_user = user
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            app.logger.exception('Batch sub-request %s %s failed', item['method'], item['path'])
+            response = app.finalize_request(({'message': 'Internal server error'}, 500), from_error_handler=True)
+
+        body = response.get_json(silent=True)
+        return response.status_code, body if body is not None else response.get_data(as_text=True)
+
+
+def run_batch(app, items, user, executor, time_budget, excluded, tracing):
+    """Execute ``items`` and return their results in request order"""
+    deadline = time.monotonic() + time_budget
+    parent = tracing.current_context()
+    results = [None] * len(items)
+
+    def run(index):
+        item = items[index]
+        left = deadline - time.monotonic()
+        if left <= 0:
+            status, body = 503, {'message': 'Batch time budget exceeded'}
+        else:
+            with tracing.span('batch.item', parent=parent,
+                              **{'http.method': item['method'], 'http.target': item['path']}):
+                headers = {deadlines.HEADER: f'{max(left, 0.001):.3f}'}
+                # The sub-request's own span continues the batch trace
+                tracing.propagator.inject(headers)
+                status, body = dispatch(app, item, user, excluded, headers)
+        results[index] = {'id': item['id'], 'status': status, 'body': body}
+
+    pending = []
+    for index, item in enumerate(items):
+        if item['method'] == 'GET':
+            pending.append(index)
+            continue
+        # A write waits for the reads before it and runs alone
+        list(executor.map(run, pending))
+        pending = []
+        executor.submit(run, index).result()
+    list(executor.map(run, pending))
+    return results
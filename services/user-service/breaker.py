@@ -0,0 +1,174 @@
+"""
+Circuit breaker around database access, with stale reads while it is open
+
+Every SQL statement reports its outcome and latency to the breaker through
+engine events. Over a rolling window, once at least ``min_calls`` statements
+ran, the circuit opens when the failure rate (connection/operational errors,
+not constraint violations) or the slow-statement rate crosses its threshold.
+
+While open, requests do not touch the database: authenticated reads of a
+single user are answered from ``StaleUserCache`` with ``Warning`` and ``Age``
+headers, everything else fails fast with 503 and ``Retry-After``. After
+``open_seconds`` the circuit is half-open: one request per
+``probe_interval`` is let through as a probe; a successful statement closes
+the circuit, a failed one re-opens it.
+
+The stale cache is per worker process and bounded both in entries (LRU) and
+in age, so it never serves a record older than ``max_age`` seconds.
+"""
+import collections
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+# Errors that mean the database is unhealthy rather than the request invalid
+UNHEALTHY_ERRORS = (exc.OperationalError, exc.InterfaceError, exc.TimeoutError)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, slow_call_seconds=2.0, slow_call_rate=0.8,
+                 min_calls=20, window_seconds=30.0, open_seconds=10.0, probe_interval=1.0):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._last_probe = 0.0
+        self._calls = collections.deque()
+        # Running totals over ``_calls`` so record() never rescans the window
+        self._failures = 0
+        self._slow_calls = 0
+        self._lock = threading.Lock()
+        self._hooked = False
+
+    def allow(self):
+        """Whether a request may use the database now"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                return True
+            return self.state == CLOSED
+
+    def retry_after(self):
+        return max(1, int(self.open_seconds - (time.monotonic() - self.opened_at) + 0.999))
+
+    def record(self, failed, duration):
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._clear()
+                return
+            if self.state == OPEN:
+                return
+
+            self._calls.append((now, failed, slow))
+            self._failures += failed
+            self._slow_calls += slow
+            while now - self._calls[0][0] > self.window_seconds:
+                _, old_failed, old_slow = self._calls.popleft()
+                self._failures -= old_failed
+                self._slow_calls -= old_slow
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            if (self._failures / total >= self.failure_rate
+                    or self._slow_calls / total >= self.slow_call_rate):
+                self._open(now)
+
+    def trip(self):
+        """Open the circuit now (operations, tests)"""
+        with self._lock:
+            self._open(time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self._clear()
+
+    def counts(self):
+        """``(calls, failures, slow calls)`` in the current window"""
+        with self._lock:
+            return len(self._calls), self._failures, self._slow_calls
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._clear()
+
+    def _clear(self):
+        self._calls.clear()
+        self._failures = 0
+        self._slow_calls = 0
+
+    # SQLAlchemy statement outcomes
+    def instrument(self):
+        if not self._hooked:
+            event.listen(Engine, 'before_cursor_execute', self._start_statement)
+            event.listen(Engine, 'after_cursor_execute', self._end_statement)
+            event.listen(Engine, 'handle_error', self._failed_statement)
+            self._hooked = True
+        return self
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._breaker_start = time.perf_counter()
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_breaker_start', None)
+        if start is not None:
+            self.record(False, time.perf_counter() - start)
+
+    def _failed_statement(self, exception_context):
+        if isinstance(exception_context.sqlalchemy_exception, UNHEALTHY_ERRORS) or exception_context.is_disconnect:
+            start = getattr(exception_context.execution_context, '_breaker_start', None)
+            self.record(True, time.perf_counter() - start if start is not None else 0.0)
+
+
+class StaleUserCache:
+    """Bounded LRU of serialized users, used only while the circuit is open"""
+
+    def __init__(self, max_entries=10000, max_age=300.0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, record):
+        with self._lock:
+            self._entries[record['id']] = (time.monotonic(), record)
+            self._entries.move_to_end(record['id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        """Return ``(record, age_seconds)`` or None when missing or too old"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[0]
+        if age > self.max_age:
+            return None
+        return entry[1], age
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,42 @@
+"""
+Change sequence for incremental sync of users
+
+Every write to a user stamps ``updated_at`` and a ``change_seq`` drawn from a
+single-row counter table in the same transaction. Incrementing the counter
+row locks it until commit, so sequence numbers become visible in the order
+they were allocated: a reader that has seen ``change_seq = n`` can never
+later find a committed change below ``n``. The lock is taken just before the
+flush, so it is held only for the remainder of the write transaction.
+
+``GET /api/users/changes`` pages through users by ``change_seq``. The cursor
+is the last sequence returned, one per database when users are sharded
+(``"12.40.7"``); counters are per database, which keeps each shard's order
+tied to its own commits.
+"""
+from sqlalchemy import insert, select, update
+
+
+def allocate(session, counter, count, **kw):
+    """Reserve ``count`` consecutive sequence numbers; return the first"""
+    result = session.execute(update(counter).values(value=counter.c.value + count), **kw)
+    if result.rowcount == 0:
+        session.execute(insert(counter).values(id=1, value=count), **kw)
+        return 1
+    return session.execute(select(counter.c.value), **kw).scalar() - count + 1
+
+
+def parse_cursor(raw, databases):
+    """Split a cursor into one sequence number per database (all zero when absent)"""
+    if not raw:
+        return [0] * databases
+    try:
+        positions = [int(part) for part in raw.split('.')]
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if len(positions) != databases or any(p < 0 for p in positions):
+        raise ValueError('Invalid cursor')
+    return positions
+
+
+def format_cursor(positions):
+    return '.'.join(str(p) for p in positions)
@@ -0,0 +1,149 @@
+"""
+Coalesced user lookups for token_required and GET /api/users/<id>
+
+``UserLookup.get(user_id)`` returns ``{'user': <USER_FIELDS record>,
+'archived': bool}`` or None. Concurrent calls for the same id in a worker
+share one in-flight load (single flight): the first caller runs the query,
+the others wait for its result instead of issuing the same query.
+
+With Redis, loaded entries are cached for ``ttl`` seconds and a miss is
+refilled by one worker only: it takes a short ``SET NX`` lock, loads and
+stores the entry while other workers poll the cache for up to ``lock_ttl``
+before loading themselves. Writes call ``invalidate()``.
+
+Ids that do not exist are remembered for ``negative_ttl`` seconds so
+enumeration traffic is answered without touching the database. With Redis
+the miss is cached there only, where ``invalidate()`` from any worker clears
+it. Without Redis it is kept in a bounded per-worker map, which only that
+worker's writes clear: a user registered by another worker can look missing
+here for up to ``negative_ttl`` seconds, so keep it short. A Redis error
+falls back to loading directly.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Run ``fn`` once for all concurrent callers with the same ``key``"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                # The leader is stuck; do not queue behind it indefinitely
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class UserLookup:
+    def __init__(self, load, redis_client=None, ttl=30.0, negative_ttl=5.0, max_negative=100000,
+                 lock_ttl=2.0, poll_interval=0.02, wait_timeout=5.0, prefix='user-cache:'):
+        self.load = load
+        self.redis = redis_client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self.prefix = prefix
+        self._flight = SingleFlight()
+        self._negative = collections.OrderedDict()
+        self._negative_lock = threading.Lock()
+
+    def get(self, user_id):
+        if self.redis is None:
+            expires = self._negative.get(user_id)
+            if expires is not None and expires > time.monotonic():
+                return None
+        return self._flight.do(user_id, lambda: self._fetch(user_id), self.wait_timeout)
+
+    def invalidate(self, user_id):
+        with self._negative_lock:
+            self._negative.pop(user_id, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.prefix + str(user_id))
+            except Exception:
+                logger.warning('Could not invalidate cached user %s', user_id, exc_info=True)
+
+    def clear(self):
+        with self._negative_lock:
+            self._negative.clear()
+
+    def _fetch(self, user_id):
+        if self.redis is not None:
+            try:
+                return self._fetch_shared(user_id)
+            except Exception:
+                logger.warning('User cache unavailable; loading user %s directly', user_id, exc_info=True)
+                return self.load(user_id)
+        entry = self.load(user_id)
+        if entry is None:
+            self._remember_missing(user_id)
+        return entry
+
+    def _fetch_shared(self, user_id):
+        key = self.prefix + str(user_id)
+        raw = self.redis.get(key)
+        if raw is not None:
+            return json.loads(raw)
+
+        lock = key + ':lock'
+        if not self.redis.set(lock, '1', nx=True, px=int(self.lock_ttl * 1000)):
+            # Another worker is refilling this entry
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                raw = self.redis.get(key)
+                if raw is not None:
+                    return json.loads(raw)
+            return self.load(user_id)
+
+        try:
+            entry = self.load(user_id)
+            ttl = self.ttl if entry is not None else self.negative_ttl
+            self.redis.set(key, json.dumps(entry), px=int(ttl * 1000))
+            return entry
+        finally:
+            self.redis.delete(lock)
+
+    def _remember_missing(self, user_id):
+        with self._negative_lock:
+            self._negative[user_id] = time.monotonic() + self.negative_ttl
+            self._negative.move_to_end(user_id)
+            while len(self._negative) > self.max_negative:
+                self._negative.popitem(last=False)
@@ -0,0 +1,98 @@
+"""
+Per-request deadlines
+
+Every request gets a time budget: the route's entry in ``REQUEST_TIMEOUTS``
+(``endpoint=seconds``), else ``REQUEST_TIMEOUT``. A client may ask for less
+with ``X-Request-Timeout: <seconds>`` but never for more than the policy.
+
+The budget is enforced in three places:
+
+* each database transaction starts with Postgres ``statement_timeout`` and
+  ``lock_timeout`` set (``SET LOCAL``) to the time left, so a slow query gives
+  its pooled connection back when the caller has stopped waiting;
+* ``check()`` before expensive steps such as password hashing refuses to start
+  work that cannot finish in time;
+* a statement cancelled by those timeouts surfaces as ``DeadlineExceeded``.
+
+``DeadlineExceeded`` is answered with 504. Outside a request (CLI, background
+threads) there is no deadline and everything here is a no-op.
+"""
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+HEADER = 'X-Request-Timeout'
+
+# query_canceled (statement_timeout) and lock_not_available (lock_timeout)
+CANCELLED_SQLSTATES = ('57014', '55P03')
+
+SET_TIMEOUTS = text("SELECT set_config('statement_timeout', :ms, true), "
+                    "set_config('lock_timeout', :ms, true)")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def parse_policy(raw):
+    """Parse ``"list_users=5,export_users=300"`` into ``{endpoint: seconds}``"""
+    policy = {}
+    for part in raw.split(','):
+        if part.strip():
+            endpoint, _, seconds = part.partition('=')
+            policy[endpoint.strip()] = float(seconds)
+    return policy
+
+
+def start(default, policy, endpoint, requested=None):
+    """Set the current request's deadline; raise ValueError for a bad header"""
+    budget = policy.get(endpoint, default)
+    if requested is not None:
+        try:
+            client_budget = float(requested)
+        except ValueError:
+            raise ValueError(f'{HEADER} must be a number of seconds')
+        if not client_budget > 0:
+            raise ValueError(f'{HEADER} must be positive')
+        budget = min(budget, client_budget)
+    g.deadline = time.monotonic() + budget
+
+
+def remaining():
+    """Seconds left for the current request, or None without a deadline"""
+    deadline = g.get('deadline') if has_request_context() else None
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(reserve=0.0, step='request'):
+    """Raise DeadlineExceeded unless at least ``reserve`` seconds remain"""
+    left = remaining()
+    if left is not None and left < reserve:
+        raise DeadlineExceeded(f'Request deadline exceeded before {step}')
+
+
+def set_database_timeouts(session, transaction, connection):
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded('Request deadline exceeded before database access')
+    if connection.dialect.name == 'postgresql':
+        connection.execute(SET_TIMEOUTS, {'ms': str(max(1, int(left * 1000)))})
+
+
+def translate_cancel(context):
+    error = context.original_exception
+    sqlstate = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+    left = remaining()
+    if sqlstate in CANCELLED_SQLSTATES and left is not None and left <= 0:
+        raise DeadlineExceeded('Database statement cancelled at the request deadline') from error
+
+
+def instrument():
+    event.listen(Session, 'after_begin', set_database_timeouts)
+    # Ahead of the circuit breaker: a cancelled statement is not a database failure
+    event.listen(Engine, 'handle_error', translate_cancel, insert=True)
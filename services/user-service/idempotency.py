@@ -0,0 +1,189 @@
+"""
+Idempotency keys for write endpoints
+
+A client may send ``Idempotency-Key: <unique value>`` with a write. The first
+request with a key claims it and runs; its response (2xx or 4xx) is stored
+for ``ttl`` seconds and replayed, with ``Idempotent-Replayed: true``, to any
+retry carrying the same key. A duplicate that arrives while the first is
+still running waits for its result instead of hashing and writing again; if
+it does not finish within ``wait_timeout`` the duplicate gets 409.
+
+Keys are scoped to the method, path and authenticated user, and bound to a
+fingerprint of the body: reusing a key for a different body is a 422.
+A 5xx or an exception releases the key so the client can retry for real, and
+an in-flight claim expires after ``lock_ttl`` in case its worker dies.
+Bodies declaring more than ``max_bytes`` get 413 before they are read or
+hashed; the view still enforces its own, possibly smaller, limit.
+
+Records live in Redis when REDIS_URL is set (``SET NX``), otherwise in the
+``idempotency_keys`` table through a session of their own, so a claim is
+visible to other workers before the request's transaction commits.
+"""
+import datetime
+import hashlib
+import json
+import random
+import time
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class RedisStore:
+    def __init__(self, redis_client, prefix='idempotency:'):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def claim(self, key, fingerprint, lock_ttl):
+        """Return None if the key was claimed for this request, else the existing record"""
+        record = json.dumps({'fingerprint': fingerprint})
+        if self.redis.set(self.prefix + key, record, nx=True, px=int(lock_ttl * 1000)):
+            return None
+        return self.get(key) or {'fingerprint': fingerprint}
+
+    def get(self, key):
+        raw = self.redis.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def complete(self, key, record, ttl):
+        self.redis.set(self.prefix + key, json.dumps(record), px=int(ttl * 1000))
+
+    def release(self, key):
+        self.redis.delete(self.prefix + key)
+
+
+class DatabaseStore:
+    def __init__(self, db, model, purge_probability=0.01):
+        self.db = db
+        self.model = model
+        self.purge_probability = purge_probability
+
+    def _session(self):
+        return Session(bind=self.db.engine)
+
+    def claim(self, key, fingerprint, lock_ttl):
+        now = datetime.datetime.utcnow()
+        with self._session() as session:
+            if random.random() < self.purge_probability:
+                session.execute(delete(self.model).where(self.model.expires_at < now))
+            existing = session.get(self.model, key)
+            if existing is not None and existing.expires_at < now:
+                session.delete(existing)
+                session.flush()
+            elif existing is not None:
+                return existing.to_record()
+            session.add(self.model(key=key, fingerprint=fingerprint,
+                                   expires_at=now + datetime.timedelta(seconds=lock_ttl)))
+            try:
+                session.commit()
+            except IntegrityError:
+                session.rollback()
+                existing = session.get(self.model, key)
+                return existing.to_record() if existing else {'fingerprint': fingerprint}
+        return None
+
+    def get(self, key):
+        with self._session() as session:
+            existing = session.get(self.model, key)
+            if existing is None or existing.expires_at < datetime.datetime.utcnow():
+                return None
+            return existing.to_record()
+
+    def complete(self, key, record, ttl):
+        with self._session() as session:
+            existing = session.get(self.model, key)
+            if existing is None:
+                return
+            existing.status = record['status']
+            existing.body = record['body']
+            existing.mimetype = record['mimetype']
+            existing.expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+            session.commit()
+
+    def release(self, key):
+        with self._session() as session:
+            session.execute(delete(self.model).where(self.model.key == key))
+            session.commit()
+
+
+class Idempotency:
+    def __init__(self, store, ttl=86400, lock_ttl=30.0, wait_timeout=10.0, poll_interval=0.05,
+                 max_bytes=None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    def __call__(self, f):
+        """Decorator honouring Idempotency-Key on a view (after token_required, if any)"""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return f(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'message': f'{HEADER} longer than {MAX_KEY_LENGTH} characters'}), 400
+
+            # token_required passes the authenticated user as the first argument
+            principal = getattr(args[0], 'id', '') if args else ''
+            scope = hashlib.sha256(
+                f'{request.method} {request.path} {principal} {key}'.encode()
+            ).hexdigest()
+            if self.max_bytes is not None and (request.content_length or 0) > self.max_bytes:
+                return jsonify({'message': f'Request body larger than {self.max_bytes} bytes'}), 413
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+            while True:
+                existing = self.store.claim(scope, fingerprint, self.lock_ttl)
+                if existing is None:
+                    break
+                response = self._wait(scope, fingerprint, existing)
+                if response is not None:
+                    return response
+                # The first attempt failed and released the key: run this one instead
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                self.store.release(scope)
+                raise
+            if response.status_code >= 500:
+                self.store.release(scope)
+            else:
+                self.store.complete(scope, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'body': response.get_data(as_text=True),
+                    'mimetype': response.mimetype,
+                }, self.ttl)
+            return response
+
+        return decorated
+
+    def _wait(self, scope, fingerprint, record):
+        """Response for a duplicate, or None once the original has released the key"""
+        deadline = time.monotonic() + self.wait_timeout
+        while record is not None and record.get('status') is None:
+            if record['fingerprint'] != fingerprint:
+                break
+            if time.monotonic() >= deadline:
+                return jsonify({'message': 'A request with this Idempotency-Key is still in progress'}), 409
+            time.sleep(self.poll_interval)
+            record = self.store.get(scope)
+
+        if record is None:
+            return None
+        if record['fingerprint'] != fingerprint:
+            return jsonify({'message': f'{HEADER} was already used with a different request body'}), 422
+
+        response = Response(record['body'], status=record['status'], mimetype=record['mimetype'])
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
@@ -0,0 +1,280 @@
+"""
+Bulk import of users from CSV or NDJSON (``flask users import``)
+
+Records are processed in chunks. For each chunk:
+
+1. Records are validated; plaintext ``password`` values are hashed across a
+   process pool, while ``password_hash`` values in a supported Werkzeug scheme
+   (scrypt or pbkdf2) are loaded as they are. Inserted users get a change
+   sequence number like any other write (see changes.py).
+2. On Postgres the chunk is streamed with ``COPY`` into a temporary staging
+   table and merged with one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``.
+   Other databases (SQLite in tests) filter existing usernames/emails and
+   insert with executemany.
+3. Rows that were not inserted (username or email already taken, also within
+   the file) or failed validation are appended to the conflict report, and
+   the checkpoint file records how many records are done.
+
+A re-run with the same input resumes after the last checkpointed chunk. If
+the process dies between a chunk's commit and its checkpoint, that chunk is
+replayed and its rows are reported as conflicts rather than duplicated.
+
+Imported users are not published to the outbox: a migration would flood
+consumers with registration events for accounts that already existed.
+"""
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import changes
+
+from sqlalchemy import insert, or_, select, text
+from werkzeug.security import generate_password_hash
+
+FORMATS = ('csv', 'ndjson')
+HASH_SCHEMES = ('scrypt:', 'pbkdf2:')
+COLUMNS = ('username', 'email', 'password_hash', 'first_name', 'last_name', 'created_at', 'is_active')
+TEXT_FIELDS = ('password', 'password_hash', 'first_name', 'last_name')
+LIMITS = {'username': 80, 'email': 120, 'password_hash': 255, 'first_name': 50, 'last_name': 50}
+REPORT_FIELDS = ('line', 'username', 'email', 'reason')
+
+
+def detect_format(path):
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def read_records(path, fmt):
+    """Yield ``(line, record)`` pairs; line numbers count data records from 1"""
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(f), 1)
+        else:
+            line = 0
+            for raw in f:
+                if raw.strip():
+                    line += 1
+                    try:
+                        yield line, json.loads(raw)
+                    except json.JSONDecodeError:
+                        yield line, None
+
+
+def parse_bool(value):
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 't')
+
+
+def validate(line, record):
+    """Return ``(row, plaintext_password, reason)``; ``reason`` is set for rejected records"""
+    if not isinstance(record, dict):
+        return None, None, 'malformed record'
+    if not record.get('username') or not record.get('email'):
+        return None, None, 'missing username or email'
+
+    # NDJSON values can be any JSON type; the string checks below need strings
+    for field in TEXT_FIELDS:
+        value = record.get(field)
+        if value not in (None, '') and not isinstance(value, str):
+            return None, None, f'{field} must be a string'
+
+    password_hash = record.get('password_hash') or None
+    password = record.get('password') or None
+    if password_hash is not None and not password_hash.startswith(HASH_SCHEMES):
+        return None, None, 'unsupported password hash scheme'
+    if password_hash is None and password is None:
+        return None, None, 'missing password or password_hash'
+
+    created_at = record.get('created_at') or None
+    if created_at is not None:
+        try:
+            created_at = datetime.datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            return None, None, 'invalid created_at'
+
+    row = {
+        'line': line,
+        'username': str(record['username']),
+        'email': str(record['email']),
+        'password_hash': password_hash,
+        'first_name': record.get('first_name') or '',
+        'last_name': record.get('last_name') or '',
+        'created_at': created_at or datetime.datetime.utcnow(),
+        'is_active': parse_bool(record.get('is_active')),
+    }
+    for column, limit in LIMITS.items():
+        if row[column] is not None and len(row[column]) > limit:
+            return None, None, f'{column} longer than {limit} characters'
+    return row, (password if password_hash is None else None), None
+
+
+def prepare(chunk, pool):
+    """Validate a chunk and hash its plaintext passwords; return ``(rows, rejected)``"""
+    rows, plaintext, rejected = [], [], []
+    for line, record in chunk:
+        row, password, reason = validate(line, record)
+        if reason is not None:
+            record = record if isinstance(record, dict) else {}
+            rejected.append({'line': line, 'username': record.get('username'),
+                             'email': record.get('email'), 'reason': reason})
+            continue
+        rows.append(row)
+        if password is not None:
+            plaintext.append((row, password))
+
+    if plaintext:
+        passwords = [password for _, password in plaintext]
+        if pool is None:
+            hashes = map(generate_password_hash, passwords)
+        else:
+            hashes = pool.map(generate_password_hash, passwords, chunksize=16)
+        for (row, _), password_hash in zip(plaintext, hashes):
+            row['password_hash'] = password_hash
+    return rows, rejected
+
+
+def load_postgres(session, counter, rows):
+    """COPY rows into a staging table and merge them into users; return the usernames inserted"""
+    session.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS users_import_staging ("
+        "line integer, username varchar(80), email varchar(120), password_hash varchar(255), "
+        "first_name varchar(50), last_name varchar(50), created_at timestamp, is_active boolean"
+        ") ON COMMIT DELETE ROWS"
+    ))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row['line']] + [
+            row[c].isoformat() if isinstance(row[c], datetime.datetime) else row[c] for c in COLUMNS
+        ])
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY users_import_staging (line, {', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+    # Allocate change sequence numbers last: the counter stays locked until commit
+    first = changes.allocate(session, counter.__table__, len(rows))
+    return set(session.execute(text(
+        f"INSERT INTO users ({', '.join(COLUMNS)}, updated_at, change_seq, login_count) "
+        f"SELECT {', '.join(COLUMNS)}, :now, :first + row_number() OVER (ORDER BY line) - 1, 0 "
+        "FROM users_import_staging ORDER BY line "
+        "ON CONFLICT DO NOTHING RETURNING username"
+    ), {'now': datetime.datetime.utcnow(), 'first': first}).scalars())
+
+
+def load_generic(session, model, counter, rows):
+    """Insert rows whose username and email are free; return the usernames inserted"""
+    existing_usernames, existing_emails = set(), set()
+    for found in session.execute(select(model.username, model.email).where(or_(
+            model.username.in_([row['username'] for row in rows]),
+            model.email.in_([row['email'] for row in rows])))):
+        existing_usernames.add(found.username)
+        existing_emails.add(found.email)
+
+    fresh = []
+    for row in rows:
+        if row['username'] in existing_usernames or row['email'] in existing_emails:
+            continue
+        existing_usernames.add(row['username'])
+        existing_emails.add(row['email'])
+        fresh.append({column: row[column] for column in COLUMNS})
+    if fresh:
+        first = changes.allocate(session, counter.__table__, len(fresh))
+        now = datetime.datetime.utcnow()
+        session.execute(insert(model.__table__), [
+            dict(row, login_count=0, updated_at=now, change_seq=first + offset)
+            for offset, row in enumerate(fresh)
+        ])
+    return {row['username'] for row in fresh}
+
+
+def conflicts(rows, inserted):
+    """Rows that did not make it into users (each inserted username is claimed once)"""
+    remaining = set(inserted)
+    report = []
+    for row in rows:
+        if row['username'] in remaining:
+            remaining.discard(row['username'])
+        else:
+            report.append({'line': row['line'], 'username': row['username'],
+                           'email': row['email'], 'reason': 'username or email already exists'})
+    return report
+
+
+def load_checkpoint(path, source):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != os.path.abspath(source) or checkpoint.get('size') != os.path.getsize(source):
+        raise ValueError(f'Checkpoint {path} belongs to a different input; use --restart')
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def run_import(session, model, counter, path, fmt=None, chunk_size=10000, workers=None,
+               checkpoint_path=None, report_path=None, restart=False, log=print):
+    """Import users from ``path``; return the totals recorded in the checkpoint.
+
+    ``workers=None`` hashes on every CPU, ``workers=0`` hashes in this process.
+    """
+    fmt = fmt or detect_format(path)
+    checkpoint_path = checkpoint_path or f'{path}.checkpoint.json'
+    report_path = report_path or f'{path}.conflicts.csv'
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, path)
+    if checkpoint is None:
+        checkpoint = {'source': os.path.abspath(path), 'size': os.path.getsize(path),
+                      'records': 0, 'inserted': 0, 'conflicts': 0, 'rejected': 0}
+        with open(report_path, 'w', newline='') as f:
+            csv.DictWriter(f, REPORT_FIELDS).writeheader()
+    elif checkpoint['records']:
+        log(f"Resuming after {checkpoint['records']} records")
+
+    postgres = session.get_bind().dialect.name == 'postgresql'
+    records = itertools.islice(read_records(path, fmt), checkpoint['records'], None)
+    pool = ProcessPoolExecutor(workers) if workers != 0 else None
+    try:
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            rows, rejected = prepare(chunk, pool)
+            try:
+                if not rows:
+                    inserted = set()
+                elif postgres:
+                    inserted = load_postgres(session, counter, rows)
+                else:
+                    inserted = load_generic(session, model, counter, rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            clashes = conflicts(rows, inserted)
+
+            with open(report_path, 'a', newline='') as f:
+                csv.DictWriter(f, REPORT_FIELDS).writerows(rejected + clashes)
+            checkpoint['records'] += len(chunk)
+            checkpoint['inserted'] += len(inserted)
+            checkpoint['conflicts'] += len(clashes)
+            checkpoint['rejected'] += len(rejected)
+            save_checkpoint(checkpoint_path, checkpoint)
+            log(f"{checkpoint['records']} records: {checkpoint['inserted']} inserted, "
+                f"{checkpoint['conflicts']} conflicts, {checkpoint['rejected']} rejected")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return checkpoint
@@ -0,0 +1,136 @@
+"""
+Write-behind tracking of last login time and login counts
+
+``login`` only records the event in process memory (a dict update under a
+lock). A background flusher coalesces events per user and applies them every
+few seconds in batched UPDATEs (``UPDATE ... FROM (VALUES ...)`` on Postgres),
+so the hottest endpoint never waits on an extra write.
+
+Bounds: at most ``max_pending`` users are buffered; events for further users
+are dropped and counted in ``dropped``. A failed flush is merged back into the
+buffer under the same bound and retried on the next tick, so a slow or
+unavailable database delays tracking but never grows memory or blocks logins.
+Shutdown: ``stop()`` (registered with atexit) makes one final flush attempt;
+anything still buffered after that is lost, which is acceptable for analytics.
+
+With sharding enabled (``router`` set) each batch is split by shard and
+applied on the shard's own connection.
+"""
+import datetime
+import logging
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class LoginTracker:
+    def __init__(self, app, db, flush_interval=5.0, max_pending=100000, batch_size=500):
+        self.app = app
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.router = None
+        self.dropped = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, when=None):
+        """Buffer one login; O(1) and never touches the database"""
+        when = when or datetime.datetime.utcnow()
+        with self._lock:
+            self._merge(user_id, when, 1)
+        if self._thread is None and not self.app.testing:
+            self.start()
+
+    def _merge(self, user_id, when, count):
+        current = self._pending.get(user_id)
+        if current is None:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += count
+                return
+            self._pending[user_id] = (when, count)
+        else:
+            self._pending[user_id] = (max(current[0], when), current[1] + count)
+
+    def flush(self):
+        """Apply buffered logins; return the number of users updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = [(user_id, when, count) for user_id, (when, count) in pending.items()]
+        applied = 0
+        try:
+            with self.app.app_context():
+                for start in range(0, len(rows), self.batch_size):
+                    self._apply(rows[start:start + self.batch_size])
+                    applied += len(rows[start:start + self.batch_size])
+        except Exception:
+            logger.exception('Login tracking flush failed; will retry')
+            with self._lock:
+                for user_id, when, count in rows[applied:]:
+                    self._merge(user_id, when, count)
+        return applied
+
+    def _apply(self, rows):
+        if self.router is None:
+            self._update(self.db.session, self.db.engine.dialect.name, rows)
+            return
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(self.router.shard_for(row[0]), []).append(row)
+        for shard_id, shard_rows in by_shard.items():
+            engine = self.router.engines[shard_id]
+            with Session(bind=engine) as session:
+                self._update(session, engine.dialect.name, shard_rows)
+
+    def _update(self, session, dialect, rows):
+        if dialect == 'postgresql':
+            values = ', '.join(
+                f"(:id{i}, CAST(:ts{i} AS timestamp), :n{i})" for i in range(len(rows))
+            )
+            params = {}
+            for i, (user_id, when, count) in enumerate(rows):
+                params.update({f'id{i}': user_id, f'ts{i}': when, f'n{i}': count})
+            session.execute(text(
+                "UPDATE users SET "
+                "last_login_at = GREATEST(COALESCE(users.last_login_at, v.ts), v.ts), "
+                "login_count = COALESCE(users.login_count, 0) + v.n "
+                f"FROM (VALUES {values}) AS v(id, ts, n) "
+                "WHERE users.id = v.id"
+            ), params)
+        else:
+            session.execute(text(
+                "UPDATE users SET "
+                "last_login_at = CASE WHEN last_login_at IS NULL OR last_login_at < :ts "
+                "THEN :ts ELSE last_login_at END, "
+                "login_count = COALESCE(login_count, 0) + :n "
+                "WHERE id = :id"
+            ), [{'id': user_id, 'ts': when, 'n': count} for user_id, when, count in rows])
+        session.commit()
+
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='login-tracker', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher and make one final flush attempt if it was running"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+            self.flush()
@@ -0,0 +1,180 @@
+"""
+Structured JSON logging that never blocks a request
+
+Every log record (application and access) goes through ``DroppingQueueHandler``
+into a bounded in-memory queue; a ``QueueListener`` thread formats records as
+one JSON object per line and writes them to stdout. When the queue is full the
+record is dropped and counted rather than waiting for the writer, and the
+next record that fits is preceded by a warning with the number dropped.
+
+``AccessLog`` emits one record per request with the route, status, latency,
+authenticated user id and time spent in SQL statements. 2xx responses can be
+sampled per endpoint (``health=0.01``) so high-volume routes do not flood the
+queue; sampled records carry their ``sample_rate`` so counts can be
+reweighted. Errors and non-2xx responses are always logged.
+"""
+import copy
+import datetime
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to whatever ``sys.stdout`` is at the time (test runners swap it)"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        # Only merge the arguments here; JSON formatting happens on the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Called with the handler lock held, so the counters need no lock of their own
+        if self.dropped > self._reported:
+            lost = self.dropped - self._reported
+            notice = logging.LogRecord('logs', logging.WARNING, __file__, 0,
+                                       '%d log records dropped: queue full', (lost,), None)
+            notice.fields = {'dropped': lost, 'dropped_total': self.dropped}
+            try:
+                self.queue.put_nowait(self.prepare(notice))
+                self._reported = self.dropped
+            except queue.Full:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(level='INFO', queue_size=10000, output='stdout'):
+    """Route the root logger through the queue; return ``(handler, started listener)``
+
+    ``output='none'`` discards records after the queue (test suites, which read
+    them from pytest's ``caplog`` instead of stdout).
+    """
+    if output == 'none':
+        writer = logging.NullHandler()
+    elif output == 'stdout':
+        writer = StdoutHandler()
+        writer.setFormatter(JsonFormatter())
+    else:
+        raise ValueError(f'Unknown log output {output!r}')
+    handler = DroppingQueueHandler(queue_size)
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(handler.queue, writer)
+    listener.start()
+    return handler, listener
+
+
+def parse_rates(raw):
+    """Parse ``"health=0.01,ready=0.1"`` into ``{endpoint: rate}``"""
+    rates = {}
+    for part in raw.split(','):
+        if part.strip():
+            endpoint, _, rate = part.partition('=')
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+class AccessLog:
+    def __init__(self, logger_name='access', sample_rate=1.0, endpoint_rates=None):
+        self.logger = logging.getLogger(logger_name)
+        self.sample_rate = sample_rate
+        self.endpoint_rates = endpoint_rates or {}
+        self._sql_hooked = False
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._log_request)
+        if not self._sql_hooked:
+            event.listen(Engine, 'before_cursor_execute', self._start_statement)
+            event.listen(Engine, 'after_cursor_execute', self._end_statement)
+            self._sql_hooked = True
+        return self
+
+    def _start_request(self):
+        g.access_start = time.perf_counter()
+        g.db_time = 0.0
+
+    def _log_request(self, response):
+        start = g.get('access_start')
+        if start is None:
+            return response
+        rate = 1.0
+        if 200 <= response.status_code < 300:
+            rate = self.endpoint_rates.get(request.endpoint, self.sample_rate)
+            if rate <= 0 or (rate < 1.0 and random.random() >= rate):
+                return response
+
+        route = request.url_rule.rule if request.url_rule else request.path
+        fields = {
+            'method': request.method,
+            'route': route,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'db_ms': round(g.get('db_time', 0.0) * 1000, 3),
+            'user_id': g.get('user_id'),
+        }
+        if rate < 1.0:
+            fields['sample_rate'] = rate
+        self.logger.info('%s %s %s', request.method, route, response.status_code, extra={'fields': fields})
+        return response
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._log_start = time.perf_counter()
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_log_start', None)
+        if start is not None and has_request_context() and 'db_time' in g:
+            g.db_time += time.perf_counter() - start
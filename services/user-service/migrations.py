@@ -0,0 +1,47 @@
+"""
+In-place upgrades of tables that predate newer columns
+
+``db.create_all()`` creates missing tables but never alters existing ones,
+so a database created by an earlier release would fail every users query
+after upgrading. ``upgrade(engine)`` runs at startup, after ``create_all``,
+on the primary database and on every shard, and adds whichever of the
+columns below are missing. It is idempotent and only issues DDL when a
+column is actually absent.
+"""
+from sqlalchemy import inspect, text
+
+# (table, column, DDL type) in the order the columns were introduced
+COLUMNS = (
+    ('users', 'last_login_at', 'TIMESTAMP'),
+    ('users', 'login_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('users', 'deactivated_at', 'TIMESTAMP'),
+    ('users', 'updated_at', 'TIMESTAMP'),
+    ('users', 'change_seq', 'BIGINT'),
+    ('users_archive', 'updated_at', 'TIMESTAMP'),
+    ('users_archive', 'change_seq', 'BIGINT'),
+)
+
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS ix_users_change_seq ON users (change_seq)',
+)
+
+
+def upgrade(engine):
+    """Add missing columns and indexes; return the columns added as ``table.column``"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    existing = {table: {c['name'] for c in inspector.get_columns(table)}
+                for table in {table for table, _, _ in COLUMNS} if table in tables}
+    # Concurrent workers may race here; Postgres can skip columns another one added
+    if_not_exists = 'IF NOT EXISTS ' if engine.dialect.name == 'postgresql' else ''
+
+    added = []
+    with engine.begin() as conn:
+        for table, column, ddl in COLUMNS:
+            if table in existing and column not in existing[table]:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {ddl}'))
+                added.append(f'{table}.{column}')
+        if 'users' in tables:
+            for statement in INDEXES:
+                conn.execute(text(statement))
+    return added
@@ -0,0 +1,88 @@
+"""
+Transactional outbox relay for user change events
+
+Request handlers add an outbox row in the same transaction as the user
+change (see ``record_event`` in app.py), so an event exists if and only if
+the change committed. This relay runs in a background thread, moves rows to
+a Redis Stream in batches and deletes them once Redis has accepted them.
+Delivery is at-least-once: a crash between XADD and DELETE republishes the
+batch, so consumers should de-duplicate on the ``event_id`` field.
+"""
+import logging
+import threading
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    def __init__(self, app, db, model, redis_client, stream='user-events',
+                 batch_size=100, poll_interval=1.0, maxlen=100000, bind=None):
+        self.app = app
+        self.db = db
+        self.bind = bind
+        self.model = model
+        self.redis = redis_client
+        self.stream = stream
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.maxlen = maxlen
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish_batch(self):
+        """Publish up to ``batch_size`` pending events; return how many were sent"""
+        with self.app.app_context():
+            if self.bind is None:
+                return self._publish(self.db.session, self.db.engine)
+            with Session(bind=self.bind) as session:
+                return self._publish(session, self.bind)
+
+    def _publish(self, session, engine):
+        query = session.query(self.model).order_by(self.model.id).limit(self.batch_size)
+        if engine.dialect.name == 'postgresql':
+            # Several workers may run a relay; each claims a disjoint batch
+            query = query.with_for_update(skip_locked=True)
+        events = query.all()
+        if not events:
+            session.rollback()
+            return 0
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for event in events:
+                # Approximate trimming keeps XADD O(1)
+                pipe.xadd(self.stream, event.to_message(), maxlen=self.maxlen, approximate=True)
+            pipe.execute()
+        except Exception:
+            session.rollback()
+            raise
+
+        for event in events:
+            session.delete(event)
+        session.commit()
+        return len(events)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.publish_batch()
+            except Exception:
+                logger.exception('Outbox relay failed to publish; retrying')
+                sent = 0
+            # Drain back-to-back while there is a backlog, otherwise poll
+            if sent < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='outbox-relay', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,36 @@
+"""
+Cached dependency checks for the readiness probe
+
+Many orchestrators (Docker, compose, load balancers) probe every few seconds.
+Each check runs at most once per ``ttl`` seconds per worker; concurrent
+probes wait for the in-flight check and reuse its result, so probe traffic
+never turns into a steady stream of queries against Postgres or Redis.
+"""
+import threading
+import time
+
+
+class CachedCheck:
+    def __init__(self, check, ttl=5.0):
+        self.check = check
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._result = None
+
+    def __call__(self):
+        """Return ``(ok, error)`` from a fresh or cached run of the check"""
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.ttl:
+                try:
+                    self.check()
+                    self._result = (True, None)
+                except Exception as e:
+                    self._result = (False, str(e))
+                self._checked_at = time.monotonic()
+            return self._result
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
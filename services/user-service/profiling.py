@@ -0,0 +1,169 @@
+"""
+Opt-in per-request profiling
+
+When PROFILING_ENABLED is set, a request is profiled if it carries a valid
+``X-Profile-Token`` (a JWT signed with SECRET_KEY, see ``issue_token``) or is
+picked by PROFILING_SAMPLE_RATE. Two profilers are available:
+
+* ``sampling`` (default): a background thread samples the request thread's
+  stack every PROFILING_INTERVAL seconds. Results are written as collapsed
+  stacks (flamegraph.pl / speedscope import) and as a speedscope JSON file.
+* ``cprofile``: deterministic cProfile, written as a ``.pstats`` file.
+
+Files go to PROFILING_DIR, which keeps at most PROFILING_MAX_FILES profiles.
+"""
+import cProfile
+import collections
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+import jwt
+
+PROFILE_HEADER = 'X-Profile-Token'
+UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def issue_token(secret_key, minutes=15):
+    """Signed token that requests profiling for the holder's requests"""
+    return jwt.encode({
+        'profile': True,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes)
+    }, secret_key, algorithm='HS256')
+
+
+def should_profile(headers, config):
+    token = headers.get(PROFILE_HEADER)
+    if token:
+        try:
+            return bool(jwt.decode(token, config['SECRET_KEY'], algorithms=['HS256']).get('profile'))
+        except jwt.InvalidTokenError:
+            return False
+    rate = config['PROFILING_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+class RequestProfile:
+    def __init__(self, config):
+        self.mode = config['PROFILING_MODE']
+        self.interval = config['PROFILING_INTERVAL']
+        self.started_at = time.perf_counter()
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = StackSampler(threading.get_ident(), self.interval).start()
+
+    def finish(self, directory, label, max_files):
+        """Stop profiling and write the result files; return the profile id"""
+        duration = time.perf_counter() - self.started_at
+        profile_id = (f"{datetime.datetime.utcnow():%Y%m%dT%H%M%S}_"
+                      f"{UNSAFE_CHARS.sub('_', label).strip('_')}_{uuid.uuid4().hex[:8]}")
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, profile_id)
+
+        if self.mode == 'cprofile':
+            self.profiler.disable()
+            self.profiler.dump_stats(f"{base}.pstats")
+        else:
+            samples = self.profiler.stop()
+            with open(f"{base}.collapsed.txt", 'w') as f:
+                for stack, count in samples.items():
+                    f.write(f"{';'.join(stack)} {count}\n")
+            with open(f"{base}.speedscope.json", 'w') as f:
+                json.dump(speedscope(samples, label, duration, self.interval), f)
+
+        prune(directory, max_files)
+        return profile_id
+
+
+def speedscope(samples, name, duration, interval):
+    """Build a speedscope 'sampled' profile from collapsed stack counts"""
+    frames, index = [], {}
+    stacks, weights = [], []
+    for stack, count in samples.items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame})
+            ids.append(index[frame])
+        stacks.append(ids)
+        weights.append(count * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'user-service',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': duration,
+            'samples': stacks,
+            'weights': weights,
+        }],
+    }
+
+
+def list_profiles(directory):
+    """Profiles in ``directory``, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = {}
+    for name in os.listdir(directory):
+        profile_id = name.split('.', 1)[0]
+        entry = profiles.setdefault(profile_id, {'id': profile_id, 'files': [], 'size': 0})
+        entry['files'].append(name)
+        entry['size'] += os.path.getsize(os.path.join(directory, name))
+    return sorted(profiles.values(), key=lambda p: p['id'], reverse=True)
+
+
+def prune(directory, max_files):
+    for profile in list_profiles(directory)[max_files:]:
+        for name in profile['files']:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,65 @@
+"""
+Request body schemas
+
+Each schema is a msgspec Struct; its JSON decoder is built once at import
+time and decodes and validates the raw body bytes in a single pass, so a
+handler never sees a ``null`` body, a wrong type or an over-long field.
+Unknown fields are ignored, as they were before.
+
+Errors are raised as ``InvalidBody`` with msgspec's message, which names
+the offending field (``Expected `str`, got `int` - at `$.email```).
+"""
+from typing import Annotated, Union
+
+import msgspec
+from msgspec import UNSET, Meta, UnsetType
+
+Username = Annotated[str, Meta(min_length=1, max_length=80)]
+Email = Annotated[str, Meta(min_length=3, max_length=120, pattern=r'^[^@\s]+@[^@\s]+$')]
+Name = Annotated[str, Meta(max_length=50)]
+# Bounded so a huge password cannot make hashing a denial of service
+Password = Annotated[str, Meta(min_length=1, max_length=1024)]
+
+
+class RegisterRequest(msgspec.Struct):
+    username: Username
+    email: Email
+    password: Password
+    first_name: Name = ''
+    last_name: Name = ''
+
+
+class LoginRequest(msgspec.Struct):
+    username: Username
+    password: Password
+
+
+class UpdateUserRequest(msgspec.Struct):
+    email: Union[Email, UnsetType] = UNSET
+    first_name: Union[Name, UnsetType] = UNSET
+    last_name: Union[Name, UnsetType] = UNSET
+
+
+class InvalidBody(ValueError):
+    def __init__(self, message, status=400, missing=False):
+        super().__init__(message)
+        self.status = status
+        self.missing = missing
+
+
+REGISTER = msgspec.json.Decoder(RegisterRequest)
+LOGIN = msgspec.json.Decoder(LoginRequest)
+UPDATE_USER = msgspec.json.Decoder(UpdateUserRequest)
+
+
+def decode(schema_decoder, body, max_bytes):
+    """Decode and validate ``body`` (bytes); raise InvalidBody on any problem"""
+    if len(body) > max_bytes:
+        raise InvalidBody(f'Request body larger than {max_bytes} bytes', status=413)
+    try:
+        return schema_decoder.decode(body)
+    except msgspec.ValidationError as e:
+        message = str(e)
+        raise InvalidBody(message, missing=message.startswith('Object missing required field'))
+    except msgspec.DecodeError as e:
+        raise InvalidBody(f'Malformed JSON body: {e}')
@@ -0,0 +1,145 @@
+"""
+Hash sharding of the users table across several databases
+
+Users live on one of SHARD_URLS, chosen by a jump consistent hash of the
+user id, so growing from N to N+1 shards moves only ~1/(N+1) of the rows.
+Ids are allocated, and username/email uniqueness enforced, by the
+``user_directory`` table on the primary database (DATABASE_URL); login and
+register resolve usernames there before touching a shard.
+
+Models sharded by the router declare how to find their user id:
+``User`` by primary key, ``OutboxEvent`` by ``user_id``, so an outbox row is
+always written to the same shard, and transaction, as its user.
+
+While rows are being moved (SHARD_REBALANCING=true) primary-key lookups
+that miss on the target shard fall back to the other shards.
+"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach) of an integer key into ``buckets``"""
+    b, j = -1, 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+class ShardRouter:
+    def __init__(self, urls, rebalancing=False, engine_options=None):
+        if not urls:
+            raise ValueError('At least one shard URL is required')
+        self.shard_ids = [f'shard{i}' for i in range(len(urls))]
+        self.engines = {
+            shard_id: create_engine(url, **(engine_options or {}))
+            for shard_id, url in zip(self.shard_ids, urls)
+        }
+        self.rebalancing = rebalancing
+        self.session = scoped_session(sessionmaker(
+            class_=ShardedSession,
+            shards=self.engines,
+            shard_chooser=self._shard_chooser,
+            identity_chooser=self._identity_chooser,
+            execute_chooser=self._execute_chooser
+        ))
+        self._executor = ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix='shard-scatter')
+
+    def shard_for(self, user_id):
+        return self.shard_ids[jump_hash(user_id, len(self.shard_ids))]
+
+    def create_tables(self, metadata, tables):
+        for engine in self.engines.values():
+            metadata.create_all(engine, tables=tables)
+
+    # ShardedSession hooks
+    def _shard_chooser(self, mapper, instance, clause=None):
+        if instance is not None:
+            return self.shard_for(getattr(instance, instance.__shard_key__))
+        raise ValueError('Statements without an instance need an explicit shard_id')
+
+    def _identity_chooser(self, mapper, primary_key, **kw):
+        if getattr(mapper.class_, '__shard_key__', None) == 'id':
+            target = self.shard_for(primary_key[0])
+            if not self.rebalancing:
+                return [target]
+            return [target] + [s for s in self.shard_ids if s != target]
+        return self.shard_ids
+
+    def _execute_chooser(self, context):
+        return self.shard_ids
+
+    def scatter(self, query_fn):
+        """Run ``query_fn(session)`` on every shard concurrently; return the results per shard"""
+        def run(engine):
+            with Session(bind=engine) as session:
+                return query_fn(session)
+        return list(self._executor.map(run, self.engines.values()))
+
+    def rebalance(self, model, batch_size=1000, log=print):
+        """Move rows of ``model`` (sharded by id) to the shard the router now assigns.
+
+        Each batch is re-read from the source with ``FOR UPDATE`` (on Postgres),
+        written to its target and only then deleted from the source, all while
+        the source rows stay locked, so a concurrent write to a source row waits
+        for the move instead of being lost. A copy already on the target (from
+        an interrupted run) is replaced by the source version unless its
+        ``updated_at`` shows it was written later (``change_seq`` counters are
+        per database, so they cannot be compared across shards). Returns the number of rows
+        moved.
+        """
+        table = model.__table__
+        moved = 0
+        for source_id, source in self.engines.items():
+            last_id = 0
+            while True:
+                with source.connect() as conn:
+                    ids = conn.execute(
+                        select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+                    ).scalars().all()
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                misplaced = {}
+                for row_id in ids:
+                    target_id = self.shard_for(row_id)
+                    if target_id != source_id:
+                        misplaced.setdefault(target_id, []).append(row_id)
+
+                for target_id, batch in misplaced.items():
+                    with source.begin() as src:
+                        locked = [dict(row) for row in src.execute(
+                            select(table).where(table.c.id.in_(batch)).with_for_update()
+                        ).mappings()]
+                        if not locked:
+                            continue
+                        with self.engines[target_id].begin() as dst:
+                            rows = self._newer_than_target(dst, table, locked)
+                            if rows:
+                                dst.execute(table.delete().where(table.c.id.in_([r['id'] for r in rows])))
+                                dst.execute(insert(table), rows)
+                        src.execute(table.delete().where(table.c.id.in_([r['id'] for r in locked])))
+                    moved += len(locked)
+                    log(f'Moved {len(locked)} rows {source_id} -> {target_id}')
+        return moved
+
+    @staticmethod
+    def _newer_than_target(conn, table, rows):
+        """Drop source rows whose target copy was updated later"""
+        if 'updated_at' not in table.c:
+            return rows
+        target_updated = dict(conn.execute(
+            select(table.c.id, table.c.updated_at).where(table.c.id.in_([r['id'] for r in rows]))
+        ).all())
+        oldest = datetime.datetime.min
+        return [row for row in rows
+                if row['id'] not in target_updated
+                or (row['updated_at'] or oldest) >= (target_updated[row['id']] or oldest)]
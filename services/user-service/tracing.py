@@ -0,0 +1,228 @@
+"""
+OpenTelemetry tracing for the user service
+
+Spans are created for every Flask request (continuing a W3C ``traceparent``
+from the caller), every SQLAlchemy statement, and the password hash/verify
+and JWT operations wrapped with ``tracing.span(...)``. Finished spans go
+through the SDK's BatchSpanProcessor, which queues them and exports from a
+background thread (dropping when the queue is full, never blocking a
+request). ``OTLPJsonFileExporter`` writes each batch as one OTLP-JSON line so
+traces can be inspected or replayed into a collector without running one.
+
+When tracing is disabled every hook is a single ``tracer is None`` check.
+"""
+import json
+import threading
+from contextlib import nullcontext
+
+from flask import g, request
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, SimpleSpanProcessor, SpanExporter, SpanExportResult
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# OTLP enumerations differ from the Python SDK's (SPAN_KIND_UNSPECIFIED = 0)
+OTLP_SPAN_KIND = {
+    SpanKind.INTERNAL: 1,
+    SpanKind.SERVER: 2,
+    SpanKind.CLIENT: 3,
+    SpanKind.PRODUCER: 4,
+    SpanKind.CONSUMER: 5,
+}
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [otlp_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+def otlp_attributes(attributes):
+    return [{'key': k, 'value': otlp_value(v)} for k, v in (attributes or {}).items()]
+
+
+class OTLPJsonFileExporter(SpanExporter):
+    """Appends each exported batch to a file as one OTLP-JSON ExportTraceServiceRequest"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        by_resource = {}
+        for span in spans:
+            scopes = by_resource.setdefault(span.resource, {})
+            scopes.setdefault(span.instrumentation_scope, []).append(self._span(span))
+
+        payload = {'resourceSpans': [
+            {
+                'resource': {'attributes': otlp_attributes(resource.attributes)},
+                'scopeSpans': [
+                    {'scope': {'name': scope.name, 'version': scope.version or ''}, 'spans': scope_spans}
+                    for scope, scope_spans in scopes.items()
+                ],
+            }
+            for resource, scopes in by_resource.items()
+        ]}
+        try:
+            with self._lock, open(self.path, 'a') as f:
+                f.write(json.dumps(payload, separators=(',', ':')) + '\n')
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    @staticmethod
+    def _span(span):
+        context = span.get_span_context()
+        data = {
+            'traceId': format(context.trace_id, '032x'),
+            'spanId': format(context.span_id, '016x'),
+            'name': span.name,
+            'kind': OTLP_SPAN_KIND.get(span.kind, 0),
+            'startTimeUnixNano': str(span.start_time),
+            'endTimeUnixNano': str(span.end_time),
+            'attributes': otlp_attributes(span.attributes),
+            'status': {'code': span.status.status_code.value},
+        }
+        if span.parent is not None:
+            data['parentSpanId'] = format(span.parent.span_id, '016x')
+        if span.status.description:
+            data['status']['message'] = span.status.description
+        if span.events:
+            data['events'] = [
+                {'name': e.name, 'timeUnixNano': str(e.timestamp), 'attributes': otlp_attributes(e.attributes)}
+                for e in span.events
+            ]
+        return data
+
+    def shutdown(self):
+        pass
+
+
+class Tracing:
+    def __init__(self):
+        self.tracer = None
+        self.provider = None
+        self.propagator = TraceContextTextMapPropagator()
+        self._sql_hooked = False
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._end_request)
+
+    def enable(self, exporter, service_name='user-service', sample_ratio=1.0, batch=True,
+               max_queue_size=2048):
+        """Start recording spans to ``exporter``"""
+        self.provider = TracerProvider(
+            resource=Resource.create({'service.name': service_name}),
+            sampler=ParentBased(TraceIdRatioBased(sample_ratio))
+        )
+        processor = (BatchSpanProcessor(exporter, max_queue_size=max_queue_size) if batch
+                     else SimpleSpanProcessor(exporter))
+        self.provider.add_span_processor(processor)
+        self.tracer = self.provider.get_tracer('user-service')
+        if not self._sql_hooked:
+            event.listen(Engine, 'before_cursor_execute', self._start_statement)
+            event.listen(Engine, 'after_cursor_execute', self._end_statement)
+            event.listen(Engine, 'handle_error', self._failed_statement)
+            self._sql_hooked = True
+        return self
+
+    def disable(self):
+        """Stop recording and flush spans still queued for export"""
+        provider, self.tracer, self.provider = self.provider, None, None
+        if provider is not None:
+            provider.shutdown()
+
+    def span(self, name, parent=None, **attributes):
+        """Context manager for an internal span; a no-op while disabled.
+
+        ``parent`` (from ``current_context()``) continues a trace on another thread.
+        """
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.start_as_current_span(name, context=parent, attributes=attributes)
+
+    def current_context(self):
+        return otel_context.get_current() if self.tracer is not None else None
+
+    # Flask request spans
+    def _start_request(self):
+        if self.tracer is None:
+            return
+        route = request.url_rule.rule if request.url_rule else request.path
+        span = self.tracer.start_span(
+            f"{request.method} {route}",
+            context=self.propagator.extract(request.headers),
+            kind=SpanKind.SERVER,
+            attributes={
+                'http.method': request.method,
+                'http.route': route,
+                'http.target': request.full_path.rstrip('?'),
+            }
+        )
+        g.trace_span = span
+        g.trace_token = otel_context.attach(trace.set_span_in_context(span))
+
+    def _finish_request(self, response):
+        span = g.get('trace_span')
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+            # Let callers correlate the response with this trace
+            self.propagator.inject(response.headers)
+        return response
+
+    def _end_request(self, exc):
+        span = g.pop('trace_span', None)
+        if span is None:
+            return
+        if exc is not None:
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR, str(exc)))
+        span.end()
+        otel_context.detach(g.pop('trace_token'))
+
+    # SQLAlchemy statement spans
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if self.tracer is None or context is None:
+            return
+        context._trace_span = self.tracer.start_span(
+            statement.split(None, 1)[0].upper() if statement else 'SQL',
+            kind=SpanKind.CLIENT,
+            attributes={
+                'db.system': conn.dialect.name,
+                'db.statement': statement,
+            }
+        )
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            span.end()
+            context._trace_span = None
+
+    def _failed_statement(self, exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, '_trace_span', None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+            context._trace_span = None
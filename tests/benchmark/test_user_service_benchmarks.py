@@ -0,0 +1,170 @@
+"""
+Microbenchmarks for User Service hot paths
+Runs in-process against the Flask app with pytest-benchmark, no live stack needed.
+The database is whatever DATABASE_URL points at (SQLite or a dedicated local
+Postgres database - tables are dropped after the run).
+Run with: ci-cd/scripts/run-benchmarks.sh [save|compare]
+"""
+import itertools
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+# Keep JSON log lines out of the benchmark output
+os.environ.setdefault('LOG_OUTPUT', 'none')
+
+import schemas
+from app import app, db, User, token_required
+from flask import jsonify
+
+PASSWORD = 'BenchPass123!'
+ROW_COUNTS = [1_000, 100_000]
+
+
+def seed_users(count):
+    """Bulk insert ``count`` users sharing one precomputed password hash"""
+    password_hash = generate_password_hash(PASSWORD)
+    rows = [
+        {
+            'username': f'bench_{i}',
+            'email': f'bench_{i}@example.com',
+            'password_hash': password_hash,
+            'first_name': 'Bench',
+            'last_name': f'User{i}',
+            'is_active': True,
+        }
+        for i in range(count)
+    ]
+    db.session.execute(insert(User), rows)
+    db.session.commit()
+
+
+@pytest.fixture(scope='module', params=ROW_COUNTS, ids=lambda n: f'{n}rows')
+def client(request):
+    """Test client backed by a users table seeded with each of ROW_COUNTS"""
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_users(request.param)
+
+    with app.test_client() as client:
+        response = client.post('/api/users/login',
+                               data=json.dumps({'username': 'bench_0', 'password': PASSWORD}),
+                               content_type='application/json')
+        token = json.loads(response.data)['token']
+        client.auth_headers = {'Authorization': f'Bearer {token}'}
+        yield client
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+class TestAuthBenchmarks:
+    def test_token_required_decode(self, benchmark, client):
+        """Benchmark JWT decode plus user lookup in token_required"""
+        protected = token_required(lambda current_user: current_user.id)
+
+        def decode():
+            with app.test_request_context(headers=client.auth_headers):
+                return protected()
+
+        assert benchmark(decode) == 1
+
+    def test_register(self, benchmark, client):
+        """Benchmark registration including password hashing"""
+        counter = itertools.count()
+
+        def register():
+            n = next(counter)
+            return client.post('/api/users/register',
+                               data=json.dumps({
+                                   'username': f'bench_reg_{n}',
+                                   'email': f'bench_reg_{n}@example.com',
+                                   'password': PASSWORD,
+                               }),
+                               content_type='application/json')
+
+        assert benchmark(register).status_code == 201
+
+    def test_login(self, benchmark, client):
+        """Benchmark login including password verification and token issue"""
+        payload = json.dumps({'username': 'bench_0', 'password': PASSWORD})
+
+        def login():
+            return client.post('/api/users/login', data=payload,
+                               content_type='application/json')
+
+        assert benchmark(login).status_code == 200
+
+
+class TestSerializationBenchmarks:
+    def test_user_to_dict(self, benchmark, client):
+        """Benchmark serializing a single user"""
+        with app.app_context():
+            user = db.session.get(User, 1)
+            assert benchmark(user.to_dict)['id'] == 1
+
+    def test_jsonify_user_list(self, benchmark, client):
+        """Benchmark jsonify of a 1k-user list response"""
+        with app.app_context():
+            users = [user.to_dict() for user in User.query.limit(1_000).all()]
+
+            def encode():
+                return jsonify({'users': users, 'total': len(users)})
+
+            assert benchmark(encode).status_code == 200
+
+
+class TestListUsersBenchmarks:
+    def test_list_users(self, benchmark, client):
+        """Benchmark GET /api/users"""
+        def list_users():
+            return client.get('/api/users', headers=client.auth_headers)
+
+        assert benchmark(list_users).status_code == 200
+
+    def test_list_users_narrow_fields(self, benchmark, client):
+        """Benchmark GET /api/users projected to id and username"""
+        def list_users():
+            return client.get('/api/users?fields=id,username',
+                              headers=client.auth_headers)
+
+        assert benchmark(list_users).status_code == 200
+
+
+class TestRequestDecodeBenchmarks:
+    """Register body decode and validation: the former ad hoc path vs the precompiled schema.
+
+    Both start from the raw body bytes; building the request context costs the same either way.
+    """
+    BODY = json.dumps({
+        'username': 'bench_decode',
+        'email': 'bench_decode@example.com',
+        'password': PASSWORD,
+        'first_name': 'Bench',
+        'last_name': 'Decode',
+    }).encode()
+
+    def test_decode_json_ad_hoc(self, benchmark):
+        """Benchmark json.loads plus the previous required-field check (what get_json did)"""
+        def decode():
+            data = json.loads(self.BODY)
+            return all(field in data for field in ['username', 'email', 'password'])
+
+        assert benchmark(decode)
+
+    def test_decode_schema(self, benchmark):
+        """Benchmark the precompiled msgspec register schema"""
+        def decode():
+            return schemas.decode(schemas.REGISTER, self.BODY, app.config['MAX_BODY_BYTES'])
+
+        assert benchmark(decode).username == 'bench_decode'
@@ -119,7 +119,7 @@ class TestUserRegistrationIntegration:
         assert 'already exists' in error_msg or 'duplicate' in error_msg
     
     def test_register_invalid_email(self, wait_for_service):
-        """Test that invalid email format is accepted (API doesn't validate format)"""
+        """Test that invalid email format is rejected"""
         user_data = {
             'username': f'testuser_{int(time.time())}',
             'email': 'invalid-email',
@@ -127,8 +127,8 @@ class TestUserRegistrationIntegration:
         }
         
         response = requests.post(f"{BASE_URL}/api/users/register", json=user_data)
-        # API currently doesn't validate email format, so this succeeds
-        assert response.status_code == 201
+        assert response.status_code == 400
+        assert '$.email' in response.json()['error']
     
     def test_register_missing_fields(self, wait_for_service):
         """Test that missing required fields are rejected"""
@@ -0,0 +1,268 @@
+"""
+Capacity sweep over gunicorn workers, threads and DB pool size
+Boots the user-service locally under every combination of --workers,
+--threads and --pool-sizes, drives each with the Locust profile at increasing
+user counts (one headless run per level, via run_load_test), and records
+aggregate throughput, p99 and error rate per level.
+
+The knee of each configuration's latency curve is the level with the highest
+power (throughput / p99) among levels within --max-error-rate and --p99-slo:
+past it, extra load buys more latency than throughput. The recommended
+configuration is the one with the highest throughput at its knee, preferring
+fewer processes, threads and connections on ties.
+
+Writes saturation.csv, saturation.html (throughput vs p99 per config) and
+recommendation.json to --output-dir.
+
+Run with:
+    DATABASE_URL=postgresql://... python capacity_sweep.py \\
+        --workers 1,2,4 --threads 1,4 --pool-sizes 5,10 --users 10,25,50,100 --step-time 1m
+"""
+import argparse
+import csv
+import html
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import yaml
+
+from load_profiles import load_profile
+from run_load_test import MASTER_PORT, read_stats, run_failure, start_locust
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.join(BASE_DIR, '..', '..', 'services', 'user-service')
+FIELDS = ('workers', 'threads', 'pool_size', 'users', 'rps', 'p95', 'p99', 'error_rate', 'knee', 'error')
+COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f')
+
+
+def int_list(raw):
+    return [int(v) for v in raw.split(',') if v.strip()]
+
+
+def start_service(config, args):
+    """Launch gunicorn for one configuration and wait until /ready answers"""
+    env = dict(os.environ,
+               DB_POOL_SIZE=str(config['pool_size']),
+               DB_MAX_OVERFLOW=str(args.max_overflow))
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--workers', str(config['workers']),
+        '--threads', str(config['threads']),
+        '--worker-class', 'gthread',
+        '--bind', f"127.0.0.1:{args.port}",
+        '--chdir', os.path.abspath(SERVICE_DIR),
+        'app:app',
+    ], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Service exited with {server.returncode} for {config}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError(f"Service not ready after {args.boot_timeout}s for {config}")
+
+
+def sweep_profile(args):
+    """Copy the Locust profile, pointed at the local service and without a load shape"""
+    profile = load_profile(args.profile)
+    profile.pop('shape', None)
+    profile.setdefault('hosts', {})['user_service'] = f"http://127.0.0.1:{args.port}"
+    path = os.path.join(args.output_dir, 'sweep_profile.yaml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(profile, f)
+    return path
+
+
+def drive(config, users, args, profile_path):
+    """One headless Locust run at ``users``; return the aggregate row
+
+    A run that crashed or wrote no stats counts as all errors, so it is never a
+    knee but does not abort the rest of the sweep.
+    """
+    prefix = os.path.join(args.output_dir, 'runs',
+                          f"w{config['workers']}_t{config['threads']}_p{config['pool_size']}_u{users}")
+    locust_args = argparse.Namespace(
+        profile=profile_path, workers=args.locust_workers, users=users,
+        spawn_rate=max(users / 10, 1), run_time=args.step_time, host=None,
+        master_port=args.master_port, user_classes=args.user_classes,
+    )
+    master, workers = start_locust(locust_args, prefix)
+    try:
+        master.wait()
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    stats_csv = f"{prefix}_stats.csv"
+    error = run_failure(master, stats_csv)
+    aggregate = read_stats(stats_csv).get('Aggregated', {}) if error is None else {}
+    return dict(config, users=users, error=error,
+                rps=aggregate.get('rps', 0.0),
+                p95=aggregate.get('p95', 0.0),
+                p99=aggregate.get('p99', 0.0),
+                error_rate=aggregate.get('error_rate', 1.0))
+
+
+def find_knee(points, max_error_rate, p99_slo=None):
+    """Index of the level with the highest throughput/p99 within limits, or None"""
+    best, best_power = None, 0.0
+    for index, point in enumerate(points):
+        if point['error_rate'] > max_error_rate or point['p99'] <= 0:
+            continue
+        if p99_slo is not None and point['p99'] > p99_slo:
+            continue
+        power = point['rps'] / point['p99']
+        if power > best_power:
+            best, best_power = index, power
+    return best
+
+
+def recommend(results):
+    """Pick the configuration with the most throughput at its knee"""
+    knees = [point for point in results if point['knee']]
+    if not knees:
+        return None
+    return max(knees, key=lambda p: (round(p['rps'], 1), -p['workers'] * p['threads'],
+                                     -p['workers'] * p['pool_size']))
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for point in results:
+            writer.writerow({field: point[field] for field in FIELDS})
+
+
+def render_html(results, recommendation, path, width=720, height=420, margin=50):
+    """Throughput vs p99 chart (one line per configuration) and the raw table"""
+    max_rps = max([p['rps'] for p in results] + [1.0])
+    max_p99 = max([p['p99'] for p in results] + [1.0])
+
+    def x(rps):
+        return margin + (width - 2 * margin) * rps / max_rps
+
+    def y(p99):
+        return height - margin - (height - 2 * margin) * p99 / max_p99
+
+    lines, legend = [], []
+    keyfunc = lambda p: (p['workers'], p['threads'], p['pool_size'])
+    for index, (key, group) in enumerate(itertools.groupby(sorted(results, key=keyfunc), key=keyfunc)):
+        group = sorted(group, key=lambda p: p['users'])
+        color = COLORS[index % len(COLORS)]
+        label = f"{key[0]} workers x {key[1]} threads, pool {key[2]}"
+        points = ' '.join(f"{x(p['rps']):.1f},{y(p['p99']):.1f}" for p in group)
+        lines.append(f'<polyline fill="none" stroke="{color}" stroke-width="2" points="{points}"/>')
+        for p in group:
+            radius = 6 if p['knee'] else 3
+            lines.append(f'<circle cx="{x(p["rps"]):.1f}" cy="{y(p["p99"]):.1f}" r="{radius}" fill="{color}">'
+                         f'<title>{html.escape(label)}: {p["users"]} users</title></circle>')
+        legend.append(f'<li style="color:{color}">{html.escape(label)}</li>')
+
+    def cell(value):
+        if isinstance(value, float):
+            return f'<td>{value:.3f}</td>'
+        return f'<td>{html.escape("" if value is None else str(value))}</td>'
+
+    rows = ''.join('<tr>' + ''.join(cell(p[field]) for field in FIELDS) + '</tr>' for p in results)
+    summary = ('No configuration stayed within the error and latency limits' if recommendation is None else
+               f"Recommended: {recommendation['workers']} workers x {recommendation['threads']} threads, "
+               f"pool {recommendation['pool_size']} - {recommendation['rps']:.1f} req/s at "
+               f"p99 {recommendation['p99']:.0f} ms with {recommendation['users']} users")
+
+    with open(path, 'w') as f:
+        f.write(f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>User service saturation report</title>
+<style>body{{font-family:sans-serif}} td,th{{padding:2px 8px;text-align:right}}</style></head>
+<body>
+<h1>User service saturation report</h1>
+<p>{html.escape(summary)}</p>
+<svg width="{width}" height="{height}" xmlns="http://www.w3.org/2000/svg">
+<line x1="{margin}" y1="{height - margin}" x2="{width - margin}" y2="{height - margin}" stroke="black"/>
+<line x1="{margin}" y1="{margin}" x2="{margin}" y2="{height - margin}" stroke="black"/>
+<text x="{width / 2}" y="{height - 10}" text-anchor="middle">throughput (req/s, max {max_rps:.0f})</text>
+<text x="15" y="{height / 2}" transform="rotate(-90 15 {height / 2})" text-anchor="middle">p99 (ms, max {max_p99:.0f})</text>
+{''.join(lines)}
+</svg>
+<p>Large markers are each configuration's knee.</p>
+<ul>{''.join(legend)}</ul>
+<table><tr>{''.join(f'<th>{field}</th>' for field in FIELDS)}</tr>{rows}</table>
+</body></html>
+""")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('user_classes', nargs='*', default=['UserServiceUser'],
+                        help='Locust user classes to run (default: UserServiceUser)')
+    parser.add_argument('--profile', default='capacity_step', help='load profile name or path (shape is ignored)')
+    parser.add_argument('--workers', type=int_list, default=[1, 2, 4], help='gunicorn worker counts')
+    parser.add_argument('--threads', type=int_list, default=[1, 4], help='threads per worker')
+    parser.add_argument('--pool-sizes', type=int_list, default=[5, 10], help='DB_POOL_SIZE values')
+    parser.add_argument('--max-overflow', type=int, default=0, help='DB_MAX_OVERFLOW for every run')
+    parser.add_argument('--users', type=int_list, default=[10, 25, 50, 100, 200], help='load levels')
+    parser.add_argument('--step-time', default='1m', help='Locust run time per load level')
+    parser.add_argument('--locust-workers', type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument('--master-port', type=int, default=MASTER_PORT)
+    parser.add_argument('--port', type=int, default=5055, help='port the service is booted on')
+    parser.add_argument('--boot-timeout', type=float, default=60)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--p99-slo', type=float, help='ignore levels whose p99 (ms) exceeds this')
+    parser.add_argument('--output-dir', default=os.path.join('reports', 'capacity'))
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.output_dir, 'runs'), exist_ok=True)
+    profile_path = sweep_profile(args)
+
+    results = []
+    for workers, threads, pool_size in itertools.product(args.workers, args.threads, args.pool_sizes):
+        config = {'workers': workers, 'threads': threads, 'pool_size': pool_size}
+        print(f"\n== {workers} workers x {threads} threads, pool {pool_size}")
+        server = start_service(config, args)
+        try:
+            points = []
+            for users in sorted(args.users):
+                point = drive(config, users, args, profile_path)
+                print(f"   {users:>5} users: {point['rps']:8.1f} req/s  p99 {point['p99']:8.0f} ms  "
+                      f"errors {point['error_rate']:.2%}" + (f"  ({point['error']})" if point['error'] else ''))
+                points.append(point)
+        finally:
+            server.terminate()
+            server.wait()
+
+        knee = find_knee(points, args.max_error_rate, args.p99_slo)
+        for index, point in enumerate(points):
+            point['knee'] = index == knee
+        results.extend(points)
+
+    recommendation = recommend(results)
+    write_csv(results, os.path.join(args.output_dir, 'saturation.csv'))
+    render_html(results, recommendation, os.path.join(args.output_dir, 'saturation.html'))
+    with open(os.path.join(args.output_dir, 'recommendation.json'), 'w') as f:
+        json.dump({'recommendation': recommendation, 'results': results}, f, indent=2)
+
+    if recommendation is None:
+        print('\nNo configuration stayed within the error and latency limits')
+        sys.exit(1)
+    print(f"\nRecommended: --workers {recommendation['workers']} --threads {recommendation['threads']} "
+          f"DB_POOL_SIZE={recommendation['pool_size']} "
+          f"({recommendation['rps']:.1f} req/s at p99 {recommendation['p99']:.0f} ms, "
+          f"{recommendation['users']} users)")
+
+
+if __name__ == '__main__':
+    main()
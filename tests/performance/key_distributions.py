@@ -0,0 +1,73 @@
+"""
+Key distributions for picking ids in synthetic Locust users
+Production traffic is heavy-tailed: a few products and accounts take most
+requests. Uniform randint() makes cache hit rates and DB buffer behaviour
+look nothing like that, so profiles can choose a skewed distribution:
+
+    key_distributions:
+      product_id: {type: zipf, max: 100, s: 1.1}
+      journey_product_id: {type: hotspot, max: 50, hot_fraction: 0.1, hot_probability: 0.9}
+"""
+import bisect
+import itertools
+import random
+
+
+class UniformKeys:
+    def __init__(self, max_id, min_id=1):
+        self.min_id = min_id
+        self.max_id = max_id
+
+    def next(self):
+        return random.randint(self.min_id, self.max_id)
+
+
+class ZipfianKeys:
+    """Ids min_id..max_id where the k-th id is drawn with probability proportional to 1/k**s"""
+
+    def __init__(self, max_id, s=1.0, shuffle=False, min_id=1):
+        self._ids = list(range(min_id, max_id + 1))
+        weights = [1 / (k ** s) for k in range(1, len(self._ids) + 1)]
+        total = sum(weights)
+        self._cdf = [c / total for c in itertools.accumulate(weights)]
+        if shuffle:
+            # Spread the hot ids across the key space instead of the lowest ids
+            random.Random(max_id).shuffle(self._ids)
+
+    def next(self):
+        index = bisect.bisect_left(self._cdf, random.random())
+        return self._ids[min(index, len(self._ids) - 1)]
+
+
+class HotspotKeys:
+    """``hot_probability`` of draws hit the first ``hot_fraction`` of ids"""
+
+    def __init__(self, max_id, hot_fraction=0.2, hot_probability=0.8, min_id=1):
+        self.min_id = min_id
+        self.max_id = max_id
+        self.hot_max_id = min_id + max(int((max_id - min_id + 1) * hot_fraction), 1) - 1
+        self.hot_probability = hot_probability
+
+    def next(self):
+        if random.random() < self.hot_probability:
+            return random.randint(self.min_id, self.hot_max_id)
+        return random.randint(self.min_id, self.max_id)
+
+
+DISTRIBUTIONS = {
+    'uniform': UniformKeys,
+    'zipf': ZipfianKeys,
+    'hotspot': HotspotKeys,
+}
+
+
+def key_generator(profile, key, default_max):
+    """Generator for ``key`` from the profile's ``key_distributions`` (uniform by default)"""
+    config = dict(profile.get('key_distributions', {}).get(key, {}))
+    kind = config.pop('type', 'uniform')
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown key distribution for {key}: {kind!r}")
+    config['max_id'] = config.pop('max', default_max)
+    if 'min' in config:
+        config['min_id'] = config.pop('min')
+    return DISTRIBUTIONS[kind](**config)
@@ -0,0 +1,131 @@
+"""
+Load profile support for the Locust suite
+A profile is a YAML or JSON file (see profiles/) that sets target hosts, the
+user class and task mix, wait times and an optional load shape.
+Select one with LOAD_PROFILE=<name or path>; the default is profiles/default.yaml.
+"""
+import json
+import os
+
+from locust import between, constant, constant_throughput
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+DEFAULT_PROFILE = 'default'
+
+
+def load_profile(name=None):
+    """Load a profile by name (from profiles/) or by file path"""
+    name = name or os.getenv('LOAD_PROFILE', DEFAULT_PROFILE)
+    path = name
+    if not os.path.isfile(path):
+        for ext in ('.yaml', '.yml', '.json'):
+            candidate = os.path.join(PROFILE_DIR, name + ext)
+            if os.path.isfile(candidate):
+                path = candidate
+                break
+        else:
+            raise FileNotFoundError(f"Load profile not found: {name}")
+
+    with open(path) as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        import yaml
+        return yaml.safe_load(f) or {}
+
+
+def parse_wait_time(spec):
+    """Build a Locust wait_time from ``[min, max]``, a number or ``{constant_throughput: n}``"""
+    if isinstance(spec, (list, tuple)):
+        return between(*spec)
+    if isinstance(spec, (int, float)):
+        return constant(spec)
+    if isinstance(spec, dict) and 'constant_throughput' in spec:
+        return constant_throughput(spec['constant_throughput'])
+    raise ValueError(f"Invalid wait_time: {spec!r}")
+
+
+def apply_profile(profile, user_classes):
+    """Configure user classes in place from the ``users`` section of a profile.
+
+    Classes missing from the section are made abstract so Locust skips them,
+    and listed classes are enabled even if they are abstract by default.
+    Task weights replace the ``@task`` weights; a weight of 0 drops the task.
+    """
+    users = profile.get('users')
+    if users is None:
+        return
+
+    unknown = set(users) - {cls.__name__ for cls in user_classes}
+    if unknown:
+        raise ValueError(f"Unknown user classes in profile: {', '.join(sorted(unknown))}")
+
+    for user_class in user_classes:
+        config = users.get(user_class.__name__)
+        if config is None or config.get('weight', 1) == 0:
+            user_class.abstract = True
+            continue
+
+        user_class.abstract = False
+        user_class.weight = config.get('weight', 1)
+        if 'fixed_count' in config:
+            user_class.fixed_count = config['fixed_count']
+        if 'wait_time' in config:
+            user_class.wait_time = parse_wait_time(config['wait_time'])
+        if 'tasks' in config:
+            tasks = []
+            for task_name, weight in config['tasks'].items():
+                method = getattr(user_class, task_name, None)
+                if not callable(method):
+                    raise ValueError(f"{user_class.__name__} has no task {task_name!r}")
+                tasks.extend([method] * weight)
+            user_class.tasks = tasks
+
+
+def build_stages(shape):
+    """Compile a shape definition into ``(duration, users, spawn_rate)`` stages.
+
+    Supported types: ``ramp``, ``step``, ``spike``, ``soak`` and ``stages``
+    (an explicit list, e.g. for a Black Friday curve).
+    """
+    kind = shape.get('type', 'stages')
+
+    if kind == 'stages':
+        return [(s['duration'], s['users'], s.get('spawn_rate', s['users']))
+                for s in shape['stages']]
+
+    if kind == 'ramp':
+        return [(shape['duration'], shape['users'], shape['spawn_rate'])]
+
+    if kind == 'step':
+        return [
+            (shape['step_duration'],
+             shape.get('start_users', 0) + shape['step_users'] * (i + 1),
+             shape.get('spawn_rate', shape['step_users']))
+            for i in range(shape['steps'])
+        ]
+
+    if kind == 'spike':
+        spawn_rate = shape.get('spawn_rate', shape['base_users'])
+        spike_spawn_rate = shape.get('spike_spawn_rate', shape['spike_users'])
+        return [
+            (shape['warmup'], shape['base_users'], spawn_rate),
+            (shape['spike_duration'], shape['spike_users'], spike_spawn_rate),
+            (shape['recovery'], shape['base_users'], spike_spawn_rate),
+        ]
+
+    if kind == 'soak':
+        ramp_time = shape.get('ramp_time', 60)
+        spawn_rate = max(shape['users'] / ramp_time, 1)
+        return [(ramp_time + shape['duration'], shape['users'], spawn_rate)]
+
+    raise ValueError(f"Unknown shape type: {kind!r}")
+
+
+def stage_at(stages, run_time):
+    """Return ``(users, spawn_rate)`` for ``run_time`` seconds, or None when finished"""
+    elapsed = 0
+    for duration, users, spawn_rate in stages:
+        elapsed += duration
+        if run_time < elapsed:
+            return users, spawn_rate
+    return None
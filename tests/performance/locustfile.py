@@ -2,10 +2,33 @@
 Performance tests for E-commerce Microservices
 Uses Locust for load testing and performance monitoring
 Run with: locust -f locustfile.py --host=http://localhost:5000
+Select a load profile with: LOAD_PROFILE=black_friday locust -f locustfile.py
+High-concurrency mode (FastHttpUser variants, one worker per core):
+    LOAD_PROFILE=high_throughput locust -f locustfile.py --headless --processes -1 FastUserServiceUser
 """
-from locust import HttpUser, task, between
+from locust import FastHttpUser, HttpUser, LoadTestShape, task, between, constant
+from locust.exception import StopUser
+import gevent
 import random
 import json
+import os
+import re
+import time
+import uuid
+
+from key_distributions import key_generator
+from load_profiles import apply_profile, build_stages, load_profile, stage_at
+from trace_replay import TraceSchedule, load_trace
+from user_pool import UserPool, pool_path
+
+PROFILE = load_profile()
+POOL_FILE = pool_path(PROFILE, os.path.dirname(os.path.abspath(__file__)))
+USER_POOL = UserPool.from_file(POOL_FILE) if POOL_FILE else None
+HOSTS = PROFILE.get('hosts', {})
+USER_SERVICE_HOST = HOSTS.get('user_service', 'http://localhost:5000')
+PRODUCT_SERVICE_HOST = HOSTS.get('product_service', 'http://localhost:8080')
+PRODUCT_IDS = key_generator(PROFILE, 'product_id', 100)
+JOURNEY_PRODUCT_IDS = key_generator(PROFILE, 'journey_product_id', 50)
 
 
 class UserServiceUser(HttpUser):
@@ -17,8 +40,21 @@ class UserServiceUser(HttpUser):
     
     def on_start(self):
         """Called when a simulated user starts"""
+        if USER_POOL:
+            # Pre-seeded account: no register/login during ramp-up
+            self.account = USER_POOL.checkout()
+            self.user_data = {
+                "username": self.account["username"],
+                "email": self.account["email"],
+                "password": self.account["password"]
+            }
+            self.token = self.account["token"]
+            self.user_id = self.account["id"]
+            self.headers = {"Authorization": f"Bearer {self.token}"}
+            return
+        
         # Register a test user
-        username = f"loadtest_user_{random.randint(1, 100000)}"
+        username = f"loadtest_user_{uuid.uuid4().hex[:12]}"
         self.user_data = {
             "username": username,
             "email": f"{username}@loadtest.com",
@@ -49,6 +85,11 @@ class UserServiceUser(HttpUser):
                 self.user_id = data.get("user", {}).get("id")
                 self.headers = {"Authorization": f"Bearer {self.token}"}
     
+    def on_stop(self):
+        """Return a pooled account so another simulated user can take it"""
+        if USER_POOL and hasattr(self, 'account'):
+            USER_POOL.checkin(self.account)
+    
     @task(3)
     def health_check(self):
         """Test health endpoint - low weight"""
@@ -80,8 +121,9 @@ class UserServiceUser(HttpUser):
     def update_profile(self):
         """Test updating user profile"""
         if hasattr(self, 'headers') and hasattr(self, 'user_id'):
+            # Unique per update: emails are unique, so a shared pool would 409/500 under load
             update_data = {
-                "email": f"updated_{random.randint(1, 1000)}@loadtest.com"
+                "email": f"updated_{self.user_id}_{uuid.uuid4().hex[:12]}@loadtest.com"
             }
             self.client.put(
                 f"/api/users/{self.user_id}",
@@ -97,7 +139,7 @@ class ProductServiceUser(HttpUser):
     Tests product browsing, search, and CRUD operations
     """
     wait_time = between(1, 5)
-    host = "http://localhost:8080"  # Product service runs on 8080
+    host = PRODUCT_SERVICE_HOST
     
     @task(10)
     def browse_products(self):
@@ -107,7 +149,7 @@ class ProductServiceUser(HttpUser):
     @task(8)
     def view_product_details(self):
         """Test viewing specific product"""
-        product_id = random.randint(1, 100)
+        product_id = PRODUCT_IDS.next()
         self.client.get(
             f"/api/products/{product_id}",
             name="/api/products/{id} [GET]"
@@ -153,6 +195,7 @@ class MixedWorkloadUser(HttpUser):
     Combines interactions across multiple services
     """
     wait_time = between(2, 6)
+    host = USER_SERVICE_HOST
     
     @task
     def user_shopping_journey(self):
@@ -163,27 +206,148 @@ class MixedWorkloadUser(HttpUser):
         3. View product details
         4. Check user profile
         """
-        # Browse products (Product Service - port 8080)
+        # Browse products (Product Service)
         self.client.get(
-            "http://localhost:8080/api/products",
+            f"{PRODUCT_SERVICE_HOST}/api/products",
             name="Journey: Browse products"
         )
         
         # Search for something
         self.client.get(
-            "http://localhost:8080/api/products/search?keyword=laptop",
+            f"{PRODUCT_SERVICE_HOST}/api/products/search?keyword=laptop",
             name="Journey: Search products"
         )
         
         # View specific product
-        product_id = random.randint(1, 50)
+        product_id = JOURNEY_PRODUCT_IDS.next()
         self.client.get(
-            f"http://localhost:8080/api/products/{product_id}",
+            f"{PRODUCT_SERVICE_HOST}/api/products/{product_id}",
             name="Journey: View product"
         )
         
-        # Check if user is logged in (User Service - port 5000)
+        # Check if user is logged in (User Service)
         self.client.get(
-            "http://localhost:5000/health",
+            f"{USER_SERVICE_HOST}/health",
             name="Journey: Check user service"
         )
+
+
+TRACE_CONFIG = PROFILE.get('trace')
+TRACE_SCHEDULE = None
+if TRACE_CONFIG:
+    TRACE_METHODS = set(TRACE_CONFIG.get('methods', ['GET']))
+    TRACE_SCHEDULE = TraceSchedule(
+        [e for e in load_trace(os.path.join(os.path.dirname(os.path.abspath(__file__)), TRACE_CONFIG['file']),
+                               TRACE_CONFIG.get('service'))
+         if e.method in TRACE_METHODS],
+        time_compression=TRACE_CONFIG.get('time_compression', 1.0),
+        loop=TRACE_CONFIG.get('loop', False)
+    )
+TRACE_KEYS = {}
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+def fill_placeholder(match):
+    """Draw an id for a ``{name}`` placeholder from the profile's key distributions"""
+    name = match.group(1)
+    if name not in TRACE_KEYS:
+        TRACE_KEYS[name] = key_generator(PROFILE, name, 100)
+    return str(TRACE_KEYS[name].next())
+
+
+class TraceReplayUser(HttpUser):
+    """
+    Replays a recorded access log with its original inter-arrival times
+    Requests are handed out in order across all replay users in the process,
+    so spawn enough users to keep up with the trace's peak concurrency.
+    Enable with a profile `trace` section and a `TraceReplayUser` users entry.
+    """
+    abstract = True
+    wait_time = constant(0)
+    host = USER_SERVICE_HOST
+    
+    def on_start(self):
+        """Borrow a pooled account for authenticated user-service paths"""
+        self.headers = {}
+        if USER_POOL:
+            self.account = USER_POOL.checkout()
+            self.headers = {"Authorization": f"Bearer {self.account['token']}"}
+    
+    def on_stop(self):
+        if USER_POOL and hasattr(self, 'account'):
+            USER_POOL.checkin(self.account)
+    
+    @task
+    def replay(self):
+        """Issue the next trace request once its scheduled time arrives"""
+        scheduled = TRACE_SCHEDULE.next() if TRACE_SCHEDULE else None
+        if scheduled is None:
+            raise StopUser()
+        
+        due, entry = scheduled
+        delay = due - time.monotonic()
+        if delay > 0:
+            gevent.sleep(delay)
+        
+        host = HOSTS.get(entry.service, '') if entry.service else ''
+        self.client.request(
+            entry.method,
+            f"{host}{PLACEHOLDER.sub(fill_placeholder, entry.path)}",
+            headers=self.headers,
+            name=f"Trace: {entry.name}"
+        )
+
+
+FAST_HTTP = PROFILE.get('fast_http', {})
+# One keep-alive connection pool per process shared by every fast user, so
+# thousands of users reuse a bounded set of sockets instead of one pool each
+FAST_CLIENT_POOL = None
+if FAST_HTTP.get('shared_pool_size'):
+    from geventhttpclient.client import HTTPClientPool
+    FAST_CLIENT_POOL = HTTPClientPool(concurrency=FAST_HTTP['shared_pool_size'])
+
+
+def fast_variant(user_class):
+    """
+    Build a FastHttpUser (geventhttpclient) copy of an HttpUser class
+    Tasks, hooks and settings are shared, so profiles can weight the fast
+    variant's tasks by the same names. Disabled unless listed in a profile.
+    """
+    # 'tasks' is rebuilt by Locust from the copied @task methods
+    attrs = {k: v for k, v in vars(user_class).items() if not k.startswith('__') and k != 'tasks'}
+    attrs.update({
+        '__module__': __name__,
+        '__doc__': f"FastHttpUser variant of {user_class.__name__}",
+        'abstract': True,
+        'network_timeout': FAST_HTTP.get('network_timeout', 60.0),
+        'connection_timeout': FAST_HTTP.get('connection_timeout', 60.0),
+        'max_retries': FAST_HTTP.get('max_retries', 1),
+        'concurrency': FAST_HTTP.get('concurrency', 10),
+        'client_pool': FAST_CLIENT_POOL,
+    })
+    return type(f"Fast{user_class.__name__}", (FastHttpUser,), attrs)
+
+
+FastUserServiceUser = fast_variant(UserServiceUser)
+FastProductServiceUser = fast_variant(ProductServiceUser)
+FastTraceReplayUser = fast_variant(TraceReplayUser)
+
+apply_profile(PROFILE, [
+    UserServiceUser, ProductServiceUser, MixedWorkloadUser, TraceReplayUser,
+    FastUserServiceUser, FastProductServiceUser, FastTraceReplayUser
+])
+
+if 'user_service' in HOSTS:
+    UserServiceUser.host = USER_SERVICE_HOST
+    FastUserServiceUser.host = USER_SERVICE_HOST
+
+if PROFILE.get('shape'):
+    class ProfileLoadShape(LoadTestShape):
+        """
+        Drives user count from the profile's shape (ramp, step, spike, soak
+        or explicit stages). Overrides --users/--spawn-rate/--run-time.
+        """
+        stages = build_stages(PROFILE['shape'])
+        
+        def tick(self):
+            return stage_at(self.stages, self.get_run_time())
@@ -0,0 +1,213 @@
+"""
+Headless distributed Locust runner with SLO gates and baseline comparison
+Starts one master and N local workers, collects the CSV stats, checks
+per-endpoint SLOs from slo.yaml, diffs against a stored baseline run and exits
+non-zero when any check fails.
+
+Run with:
+    python run_load_test.py --workers 4 --users 100 --run-time 2m UserServiceUser
+    python run_load_test.py --save-baseline ...   # record the current run as baseline
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SLO_FILE = os.path.join(BASE_DIR, 'slo.yaml')
+BASELINE_DIR = os.path.join(BASE_DIR, 'baselines')
+MASTER_PORT = 5557
+
+
+def start_locust(args, output_prefix):
+    """Launch the master and workers; return (master, workers)"""
+    env = dict(os.environ, LOAD_PROFILE=args.profile)
+    locust = [sys.executable, '-m', 'locust', '-f', os.path.join(BASE_DIR, 'locustfile.py')]
+
+    master_cmd = locust + [
+        '--master', '--headless',
+        '--master-bind-port', str(args.master_port),
+        '--expect-workers', str(args.workers),
+        '--users', str(args.users),
+        '--spawn-rate', str(args.spawn_rate),
+        '--run-time', args.run_time,
+        '--csv', output_prefix,
+        '--html', f"{output_prefix}.html",
+        '--exit-code-on-error', '0',
+    ]
+    if args.host:
+        master_cmd += ['--host', args.host]
+    master_cmd += args.user_classes
+
+    master = subprocess.Popen(master_cmd, env=env)
+    # Give the master a moment to bind before workers connect
+    time.sleep(1)
+    workers = [
+        subprocess.Popen(locust + ['--worker', '--master-host', '127.0.0.1',
+                                   '--master-port', str(args.master_port)] + args.user_classes,
+                         env=env, stdout=subprocess.DEVNULL)
+        for _ in range(args.workers)
+    ]
+    return master, workers
+
+
+def number(value):
+    """Float from a Locust CSV cell; empty and 'N/A' (no successful samples) are 0"""
+    return float(value) if value not in ('', 'N/A', None) else 0.0
+
+
+def run_failure(master, stats_csv):
+    """Why a finished Locust run has no usable stats, or None"""
+    # Locust exits 1 whenever a request failed; the SLO checks judge those runs
+    if master.returncode not in (0, 1):
+        return f"Locust master exited with code {master.returncode}"
+    if not os.path.isfile(stats_csv):
+        return f"Locust wrote no stats file ({stats_csv})"
+    return None
+
+
+def read_stats(stats_csv):
+    """Summarize Locust's <prefix>_stats.csv keyed by request name"""
+    stats = {}
+    with open(stats_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            requests = int(row['Request Count'])
+            failures = int(row['Failure Count'])
+            stats[row['Name']] = {
+                'requests': requests,
+                'failures': failures,
+                'error_rate': failures / requests if requests else 0.0,
+                'avg': number(row['Average Response Time']),
+                'p95': number(row['95%']),
+                'p99': number(row['99%']),
+                'rps': number(row['Requests/s']),
+            }
+    return stats
+
+
+def check_slos(stats, slo_config):
+    """Return a list of (endpoint, check, actual, limit, passed)"""
+    defaults = slo_config.get('defaults', {})
+    endpoints = slo_config.get('endpoints', {})
+    min_requests = slo_config.get('min_requests', 1)
+    results = []
+
+    for name, result in stats.items():
+        # The aggregate row is only gated when it has its own entry
+        if name == 'Aggregated' and name not in endpoints:
+            continue
+        if result['requests'] < min_requests:
+            continue
+        limits = dict(defaults, **endpoints.get(name, {}))
+        for check in ('p95', 'p99', 'error_rate'):
+            if check in limits:
+                results.append((name, check, result[check], limits[check],
+                                result[check] <= limits[check]))
+    return results
+
+
+def compare_baseline(stats, baseline, slo_config):
+    """Return a list of (endpoint, check, actual, baseline, passed) regression checks"""
+    regression_config = slo_config.get('regression', {})
+    max_increase = regression_config.get('max_latency_increase_pct', 20) / 100
+    max_error_increase = regression_config.get('max_error_rate_increase', 0.01)
+    min_requests = slo_config.get('min_requests', 1)
+    results = []
+
+    for name, result in stats.items():
+        previous = baseline.get(name)
+        if not previous or result['requests'] < min_requests:
+            continue
+        for check in ('p95', 'p99'):
+            limit = previous[check] * (1 + max_increase)
+            results.append((name, f"{check} vs baseline", result[check], previous[check],
+                            result[check] <= limit))
+        results.append((name, 'error_rate vs baseline', result['error_rate'], previous['error_rate'],
+                        result['error_rate'] <= previous['error_rate'] + max_error_increase))
+    return results
+
+
+def print_report(title, rows):
+    print(f"\n{title}")
+    print(f"{'Endpoint':<45} {'Check':<24} {'Actual':>10} {'Limit':>10}  Result")
+    for name, check, actual, limit, passed in rows:
+        print(f"{name:<45} {check:<24} {actual:>10.3f} {limit:>10.3f}  {'PASS' if passed else 'FAIL'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('user_classes', nargs='*', help='Locust user classes to run (default: all in the profile)')
+    parser.add_argument('--profile', default=os.getenv('LOAD_PROFILE', 'default'), help='load profile name or path')
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) - 1, 1))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--spawn-rate', type=float, default=5)
+    parser.add_argument('--run-time', default='2m')
+    parser.add_argument('--host', help='override the profile host')
+    parser.add_argument('--master-port', type=int, default=MASTER_PORT)
+    parser.add_argument('--slo', default=DEFAULT_SLO_FILE, help='SLO config file')
+    parser.add_argument('--baseline', help='baseline summary JSON (default: baselines/<profile>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--output-dir', default=os.path.join('reports', 'performance'))
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_prefix = os.path.join(args.output_dir, 'run')
+    profile_name = os.path.splitext(os.path.basename(args.profile))[0]
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{profile_name}.json")
+
+    master, workers = start_locust(args, output_prefix)
+    try:
+        master.wait()
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    stats_csv = f"{output_prefix}_stats.csv"
+    error = run_failure(master, stats_csv)
+    stats = read_stats(stats_csv) if error is None else {}
+    with open(args.slo) as f:
+        slo_config = yaml.safe_load(f) or {}
+
+    slo_results = check_slos(stats, slo_config)
+    regression_results = []
+    if os.path.isfile(baseline_path) and not args.save_baseline and error is None:
+        with open(baseline_path) as f:
+            regression_results = compare_baseline(stats, json.load(f), slo_config)
+
+    passed = error is None and all(r[-1] for r in slo_results + regression_results)
+    if error is not None:
+        print(f"\nLoad test run failed: {error}")
+    print_report('SLO checks', slo_results)
+    if regression_results:
+        print_report(f"Regression checks against {baseline_path}", regression_results)
+
+    with open(f"{output_prefix}_report.json", 'w') as f:
+        json.dump({
+            'profile': profile_name,
+            'passed': passed,
+            'error': error,
+            'stats': stats,
+            'slo_checks': [dict(zip(('endpoint', 'check', 'actual', 'limit', 'passed'), r)) for r in slo_results],
+            'regression_checks': [dict(zip(('endpoint', 'check', 'actual', 'baseline', 'passed'), r))
+                                  for r in regression_results],
+        }, f, indent=2)
+
+    if args.save_baseline and error is None:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(stats, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+
+    print(f"\nPerformance gate: {'PASSED' if passed else 'FAILED'}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
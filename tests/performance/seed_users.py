@@ -0,0 +1,134 @@
+"""
+Seed a pool of load-test users with known credentials and pre-issued tokens
+Writes a JSON data file that the Locust suite checks accounts out of, so
+simulated users skip register/login in on_start and never collide.
+
+Direct database mode (fast, needs DATABASE_URL and the service's SECRET_KEY;
+inserts through the app's models so updated_at/change_seq are stamped as for
+a registration; not available with SHARD_URLS, use API mode there):
+    python seed_users.py --count 10000
+API mode (works against any deployment, pays password hashing per user):
+    python seed_users.py --count 500 --base-url http://localhost:5000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_POOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'user_pool.json')
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'services', 'user-service')
+BATCH_SIZE = 1000
+
+
+def account(index, prefix, password):
+    username = f"{prefix}_{index}"
+    return {
+        'username': username,
+        'email': f"{username}@loadtest.com",
+        'password': password,
+    }
+
+
+def seed_database(accounts, token_hours):
+    """Insert missing users through the ORM and sign tokens with the app's SECRET_KEY"""
+    sys.path.insert(0, os.path.abspath(SERVICE_DIR))
+    import jwt
+    from werkzeug.security import generate_password_hash
+    import app as app_module
+    from app import app, db, User
+
+    if app_module.shards is not None:
+        # Users live on their shard and need a directory entry; registration handles both
+        sys.exit('Direct database seeding does not support SHARD_URLS; use --base-url')
+
+    hashes = {}
+    expires = datetime.datetime.utcnow() + datetime.timedelta(hours=token_hours)
+
+    with app.app_context():
+        for start in range(0, len(accounts), BATCH_SIZE):
+            batch = accounts[start:start + BATCH_SIZE]
+            usernames = [a['username'] for a in batch]
+            ids = dict(db.session.query(User.username, User.id)
+                       .filter(User.username.in_(usernames)).all())
+
+            missing = [a for a in batch if a['username'] not in ids]
+            if missing:
+                users = []
+                for a in missing:
+                    # One hash per distinct password keeps seeding I/O bound
+                    if a['password'] not in hashes:
+                        hashes[a['password']] = generate_password_hash(a['password'])
+                    users.append(User(
+                        username=a['username'],
+                        email=a['email'],
+                        password_hash=hashes[a['password']],
+                        first_name='Load',
+                        last_name='Test',
+                        is_active=True,
+                    ))
+                # The session's before_flush hook stamps updated_at and change_seq
+                db.session.add_all(users)
+                db.session.commit()
+                ids.update({user.username: user.id for user in users})
+
+            for a in batch:
+                a['id'] = ids[a['username']]
+                a['token'] = jwt.encode({
+                    'user_id': a['id'],
+                    'username': a['username'],
+                    'exp': expires
+                }, app.config['SECRET_KEY'], algorithm='HS256')
+
+    return accounts
+
+
+def seed_api(accounts, base_url, concurrency):
+    """Register (tolerating existing users) and log in through the public API"""
+    import requests
+
+    def seed_one(a):
+        session = requests.Session()
+        session.post(f"{base_url}/api/users/register", json=a, timeout=30)
+        response = session.post(f"{base_url}/api/users/login",
+                                json={'username': a['username'], 'password': a['password']},
+                                timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        a['id'] = data['user']['id']
+        a['token'] = data['token']
+        return a
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(seed_one, accounts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000, help='number of accounts in the pool')
+    parser.add_argument('--prefix', default='pool_user', help='username prefix')
+    parser.add_argument('--password', default='LoadTest123!', help='password shared by all accounts')
+    parser.add_argument('--token-hours', type=int, default=24, help='token lifetime (database mode)')
+    parser.add_argument('--base-url', help='seed through the API at this URL instead of the database')
+    parser.add_argument('--concurrency', type=int, default=16, help='parallel requests (API mode)')
+    parser.add_argument('--output', default=DEFAULT_POOL_FILE, help='pool data file to write')
+    args = parser.parse_args()
+
+    accounts = [account(i, args.prefix, args.password) for i in range(args.count)]
+    if args.base_url:
+        accounts = seed_api(accounts, args.base_url.rstrip('/'), args.concurrency)
+    else:
+        accounts = seed_database(accounts, args.token_hours)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'generated_at': datetime.datetime.utcnow().isoformat(),
+            'accounts': accounts
+        }, f)
+    print(f"Wrote {len(accounts)} accounts to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
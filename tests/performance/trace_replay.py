@@ -0,0 +1,100 @@
+"""
+Access-log trace loading and scheduling for TraceReplayUser
+Accepts either a CSV trace with a header row:
+
+    timestamp,method,path,service
+    0.000,GET,/api/products/42,product_service
+    0.130,GET,/api/users/{user_id},user_service
+
+(timestamp in seconds or ISO 8601; ``{name}`` placeholders are filled from the
+profile's key distribution of that name), or a raw access log in common/combined log
+format as written by nginx or gunicorn. Recorded paths are replayed as-is so
+the production key distribution is preserved; request names collapse numeric
+segments so stats group by endpoint.
+"""
+import csv
+import datetime
+import re
+import time
+
+ACCESS_LOG_PATTERN = re.compile(
+    r'\[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<path>\S+)[^"]*"'
+)
+ACCESS_LOG_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+NUMERIC_SEGMENT = re.compile(r'/\d+(?=/|$|\?)')
+
+
+class TraceEntry:
+    __slots__ = ('offset', 'method', 'path', 'service', 'name')
+
+    def __init__(self, offset, method, path, service=None):
+        self.offset = offset
+        self.method = method.upper()
+        self.path = path
+        self.service = service or None
+        self.name = f"{NUMERIC_SEGMENT.sub('/{id}', path.split('?')[0])} [{self.method}]"
+
+
+def parse_timestamp(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def load_trace(path, default_service=None):
+    """Load a trace file into entries with offsets relative to the first request"""
+    with open(path, newline='') as f:
+        first_line = f.readline()
+        f.seek(0)
+        if first_line.startswith('timestamp'):
+            rows = [(parse_timestamp(r['timestamp']), r['method'], r['path'], r.get('service'))
+                    for r in csv.DictReader(f)]
+        else:
+            by_second = {}
+            for line in f:
+                match = ACCESS_LOG_PATTERN.search(line)
+                if match:
+                    when = datetime.datetime.strptime(match['time'], ACCESS_LOG_TIME_FORMAT)
+                    by_second.setdefault(when.timestamp(), []).append((match['method'], match['path']))
+            # Log timestamps have one-second resolution: spread each second's
+            # requests evenly across it instead of bursting them together
+            rows = [(second + i / len(requests), method, p, None)
+                    for second, requests in by_second.items()
+                    for i, (method, p) in enumerate(requests)]
+
+    if not rows:
+        raise ValueError(f"No requests found in trace {path}")
+    rows.sort(key=lambda row: row[0])
+    start = rows[0][0]
+    return [TraceEntry(ts - start, method, p, service or default_service)
+            for ts, method, p, service in rows]
+
+
+class TraceSchedule:
+    """Hands out trace entries in order with their due wall-clock time.
+
+    Shared by all replay users in a process; ``time_compression`` > 1 replays
+    faster than recorded. Returns None once the trace ends unless ``loop``.
+    """
+
+    def __init__(self, entries, time_compression=1.0, loop=False):
+        self.entries = entries
+        self.time_compression = time_compression
+        self.loop = loop
+        self.duration = entries[-1].offset
+        self._index = 0
+        self._started_at = None
+
+    def next(self):
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if self._index >= len(self.entries):
+            if not self.loop:
+                return None
+            # Restart the trace as if it had been recorded back to back
+            self._index = 0
+            self._started_at += (self.duration + 1) / self.time_compression
+        entry = self.entries[self._index]
+        self._index += 1
+        return self._started_at + entry.offset / self.time_compression, entry
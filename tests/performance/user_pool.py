@@ -0,0 +1,56 @@
+"""
+Pre-seeded account pool for the Locust suite (see seed_users.py)
+Simulated users check an account out in on_start and return it in on_stop.
+Each process shuffles its copy so distributed workers don't all start on the
+same accounts. When more users are running than accounts exist, accounts are
+shared round-robin rather than registering new ones; only accounts that were
+handed out exclusively go back on the free list, so a shared copy is never
+given to a second user as if it were free.
+"""
+import collections
+import itertools
+import json
+import os
+import random
+
+
+class UserPool:
+    def __init__(self, accounts):
+        if not accounts:
+            raise ValueError("User pool is empty")
+        accounts = random.sample(accounts, len(accounts))
+        self._free = collections.deque(accounts)
+        self._shared = itertools.cycle(accounts)
+        # Identities of the account dicts currently checked out from _free
+        self._checked_out = set()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f)['accounts'])
+
+    def checkout(self):
+        """Take a free account, or share one once the pool is exhausted"""
+        if self._free:
+            account = self._free.popleft()
+            self._checked_out.add(id(account))
+            return account
+        # A copy, so its checkin cannot be mistaken for the exclusive holder's
+        return dict(next(self._shared))
+
+    def checkin(self, account):
+        if id(account) in self._checked_out:
+            self._checked_out.remove(id(account))
+            self._free.append(account)
+
+
+def pool_path(profile, base_dir):
+    """Pool file from USER_POOL_FILE or the profile's ``user_pool`` key, if any"""
+    path = os.getenv('USER_POOL_FILE') or profile.get('user_pool')
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"User pool file not found: {path} (run seed_users.py)")
+    return path
@@ -1,6 +1,30 @@
 import pytest
+import datetime
 import json
-from app import app, db, User
+import os
+import sys
+import threading
+import time
+
+# JSON logs would flood pytest's output; tests read records through caplog
+os.environ.setdefault('LOG_OUTPUT', 'none')
+
+import app as app_module
+from app import app, db, User, ArchivedUser, ChangeCounter, OutboxEvent
+from outbox import OutboxRelay
+from login_tracker import LoginTracker
+import profiling
+from tracing import OTLPJsonFileExporter
+from sharding import ShardRouter, jump_hash
+from idempotency import Idempotency, RedisStore
+from breaker import CircuitBreaker, StaleUserCache
+import deadlines
+import logging
+import logs
+from coalescing import SingleFlight, UserLookup
+import importer
+import migrations
+from werkzeug.security import generate_password_hash
 
 @pytest.fixture
 def client():
@@ -52,6 +76,44 @@ class TestHealthEndpoint:
         assert data['status'] == 'healthy'
         assert data['service'] == 'user-service'
 
+class TestProbes:
+    def test_live(self, client):
+        """Test liveness probe returns 200 without dependency checks"""
+        response = client.get('/live')
+        
+        assert response.status_code == 200
+        assert json.loads(response.data)['status'] == 'alive'
+    
+    def test_ready(self, client):
+        """Test readiness probe reports the database check"""
+        app_module.readiness_checks['database'].invalidate()
+        response = client.get('/ready')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['status'] == 'ready'
+        assert data['checks']['database'] == 'ok'
+    
+    def test_ready_failure_is_cached(self, client):
+        """Test a failing check returns 503 and is not re-run within the TTL"""
+        calls = []
+        
+        def failing():
+            calls.append(1)
+            raise RuntimeError('db down')
+        
+        check = app_module.readiness_checks['database']
+        original = check.check
+        check.check = failing
+        check.invalidate()
+        try:
+            assert client.get('/ready').status_code == 503
+            assert client.get('/ready').status_code == 503
+            assert len(calls) == 1
+        finally:
+            check.check = original
+            check.invalidate()
+
 class TestUserRegistration:
     def test_register_user_success(self, client):
         """Test successful user registration"""
@@ -273,6 +335,217 @@ class TestAuthenticatedEndpoints:
         data = json.loads(response.data)
         assert 'deactivated successfully' in data['message']
 
+class TestSparseFieldsets:
+    def test_list_users_with_fields(self, client, auth_headers):
+        """Test listing users restricted to requested fields"""
+        response = client.get('/api/users?fields=id,username', headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['users'][0] == {'id': 1, 'username': 'testuser'}
+    
+    def test_get_user_with_fields(self, client, auth_headers):
+        """Test getting a user restricted to requested fields"""
+        response = client.get('/api/users/1?fields=username,created_at', headers=auth_headers)
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert set(data['user']) == {'username', 'created_at'}
+    
+    def test_unknown_field_rejected(self, client, auth_headers):
+        """Test fields outside the allow-list are rejected"""
+        response = client.get('/api/users?fields=id,password_hash', headers=auth_headers)
+        
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        assert 'password_hash' in data['message']
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.pending = []
+    
+    def xadd(self, stream, fields, **kwargs):
+        self.pending.append((stream, fields))
+    
+    def execute(self):
+        if self.redis.fail:
+            raise ConnectionError('redis down')
+        self.redis.messages.extend(self.pending)
+
+class FakeRedis:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.messages = []
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+@pytest.fixture
+def no_relay():
+    """Stop the background relay so tests can inspect the outbox table"""
+    if app_module.outbox_relay:
+        app_module.outbox_relay.stop()
+
+class TestOutbox:
+    def test_writes_record_events(self, client, auth_headers, no_relay):
+        """Test register, update and delete each add an outbox event"""
+        client.put('/api/users/1',
+                   data=json.dumps({'first_name': 'Changed'}),
+                   headers=auth_headers,
+                   content_type='application/json')
+        client.delete('/api/users/1', headers=auth_headers)
+        
+        with app.app_context():
+            events = OutboxEvent.query.order_by(OutboxEvent.id).all()
+            assert [e.event_type for e in events] == [
+                'user.registered', 'user.updated', 'user.deactivated'
+            ]
+            assert json.loads(events[1].payload)['first_name'] == 'Changed'
+    
+    def test_event_payload_carries_written_change(self, client, auth_headers, no_relay):
+        """Test events carry the updated_at and change_seq of the write they record"""
+        client.put('/api/users/1', json={'first_name': 'Changed'}, headers=auth_headers)
+        
+        with app.app_context():
+            user = db.session.get(User, 1)
+            registered, updated = [json.loads(e.payload) for e in OutboxEvent.query.order_by(OutboxEvent.id)]
+            assert registered['updated_at'] == registered['created_at']
+            assert registered['change_seq'] == 1
+            assert updated['change_seq'] == user.change_seq == 2
+            assert updated['updated_at'] == user.updated_at.isoformat()
+    
+    def test_failed_register_records_no_event(self, client, auth_headers, no_relay):
+        """Test a rejected registration leaves no event behind"""
+        client.post('/api/users/register',
+                    data=json.dumps({'username': 'testuser', 'email': 'x@example.com', 'password': 'Pass123!'}),
+                    content_type='application/json')
+        
+        with app.app_context():
+            assert OutboxEvent.query.count() == 1
+    
+    def test_relay_publishes_and_deletes(self, client, auth_headers, no_relay):
+        """Test the relay moves events to the stream and clears the outbox"""
+        redis = FakeRedis()
+        relay = OutboxRelay(app, db, OutboxEvent, redis, stream='test-events')
+        
+        assert relay.publish_batch() == 1
+        assert redis.messages[0][0] == 'test-events'
+        assert redis.messages[0][1]['event_type'] == 'user.registered'
+        with app.app_context():
+            assert OutboxEvent.query.count() == 0
+    
+    def test_relay_keeps_events_when_redis_fails(self, client, auth_headers, no_relay):
+        """Test events stay in the outbox for retry when Redis is down"""
+        relay = OutboxRelay(app, db, OutboxEvent, FakeRedis(fail=True))
+        
+        with pytest.raises(ConnectionError):
+            relay.publish_batch()
+        with app.app_context():
+            assert OutboxEvent.query.count() == 1
+
+class TestLoginTracking:
+    def test_login_is_buffered_then_flushed(self, client, auth_headers):
+        """Test login only buffers the event until the tracker flushes"""
+        app_module.login_tracker.flush()
+        with app.app_context():
+            count = db.session.get(User, 1).login_count
+        
+        client.post('/api/users/login',
+                    data=json.dumps({'username': 'testuser', 'password': 'TestPass123!'}),
+                    content_type='application/json')
+        
+        with app.app_context():
+            assert db.session.get(User, 1).login_count == count
+        
+        assert app_module.login_tracker.flush() == 1
+        with app.app_context():
+            user = db.session.get(User, 1)
+            assert user.login_count == count + 1
+            assert user.last_login_at is not None
+    
+    def test_pending_users_are_bounded(self, client, auth_headers):
+        """Test events for users beyond max_pending are dropped and counted"""
+        tracker = LoginTracker(app, db, max_pending=1)
+        tracker.record(1)
+        tracker.record(1)
+        tracker.record(2)
+        
+        assert tracker.dropped == 1
+        assert tracker.flush() == 1
+        with app.app_context():
+            assert db.session.get(User, 1).login_count == 2
+
+@pytest.fixture
+def profiling_enabled(tmp_path):
+    """Enable profiling into a temporary directory"""
+    app.config.update(PROFILING_ENABLED=True, PROFILING_DIR=str(tmp_path))
+    yield tmp_path
+    app.config['PROFILING_ENABLED'] = False
+
+class TestProfiling:
+    def test_signed_header_profiles_request(self, client, auth_headers, profiling_enabled):
+        """Test a valid profile token captures speedscope and collapsed files"""
+        headers = dict(auth_headers)
+        headers[profiling.PROFILE_HEADER] = profiling.issue_token(app.config['SECRET_KEY'])
+        response = client.get('/api/users', headers=headers)
+        
+        profile_id = response.headers['X-Profile-Id']
+        assert (profiling_enabled / f'{profile_id}.speedscope.json').exists()
+        assert (profiling_enabled / f'{profile_id}.collapsed.txt').exists()
+        
+        listing = json.loads(client.get('/api/admin/profiles', headers=auth_headers).data)
+        assert listing['profiles'][0]['id'] == profile_id
+    
+    def test_invalid_token_not_profiled(self, client, profiling_enabled):
+        """Test an unsigned profile header is ignored"""
+        response = client.get('/health', headers={profiling.PROFILE_HEADER: 'forged'})
+        
+        assert 'X-Profile-Id' not in response.headers
+        assert list(profiling_enabled.iterdir()) == []
+    
+    def test_disabled_by_default(self, client):
+        """Test profiling does nothing unless enabled"""
+        headers = {profiling.PROFILE_HEADER: profiling.issue_token(app.config['SECRET_KEY'])}
+        response = client.get('/health', headers=headers)
+        
+        assert 'X-Profile-Id' not in response.headers
+
+@pytest.fixture
+def trace_file(tmp_path):
+    """Record spans synchronously to an OTLP-JSON file"""
+    path = tmp_path / 'traces.jsonl'
+    app_module.tracing.enable(OTLPJsonFileExporter(str(path)), batch=False)
+    yield path
+    app_module.tracing.disable()
+
+def exported_spans(path):
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource_spans in json.loads(line)['resourceSpans']:
+            for scope_spans in resource_spans['scopeSpans']:
+                spans.extend(scope_spans['spans'])
+    return spans
+
+class TestTracing:
+    def test_login_spans_continue_traceparent(self, client, auth_headers, trace_file):
+        """Test login emits request, SQL, hash and JWT spans under the caller's trace"""
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        parent_id = '00f067aa0ba902b7'
+        response = client.post('/api/users/login',
+                               data=json.dumps({'username': 'testuser', 'password': 'TestPass123!'}),
+                               headers={'traceparent': f'00-{trace_id}-{parent_id}-01'},
+                               content_type='application/json')
+        
+        assert response.headers['traceparent'].startswith(f'00-{trace_id}-')
+        spans = exported_spans(trace_file)
+        names = {span['name'] for span in spans}
+        assert {'POST /api/users/login', 'SELECT', 'password.verify', 'jwt.encode'} <= names
+        assert all(span['traceId'] == trace_id for span in spans)
+        server = next(span for span in spans if span['name'] == 'POST /api/users/login')
+        assert server['parentSpanId'] == parent_id
+        assert server['kind'] == 2
+
 class TestUserModel:
     def test_user_model_creation(self, client):
         """Test User model creation"""
@@ -308,6 +581,925 @@ class TestUserModel:
             assert 'password_hash' not in user_dict
             assert 'password' not in user_dict
 
+def register(client, username):
+    return client.post('/api/users/register',
+                       data=json.dumps({'username': username, 'email': f'{username}@example.com',
+                                        'password': 'TestPass123!'}),
+                       content_type='application/json')
+
+@pytest.fixture
+def sharded(client, tmp_path):
+    """Spread users over three SQLite shards for the duration of a test"""
+    router = app_module.configure_sharding([f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)])
+    yield router
+    app_module.configure_sharding([])
+
+class TestSchemaUpgrade:
+    def test_adds_columns_missing_from_earlier_releases(self, tmp_path):
+        """Test a users table created before the newer columns is upgraded in place"""
+        engine = db.create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            conn.execute(db.text('CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL, '
+                                 'email VARCHAR(120) NOT NULL, password_hash VARCHAR(255) NOT NULL, '
+                                 'first_name VARCHAR(50), last_name VARCHAR(50), created_at TIMESTAMP, '
+                                 'is_active BOOLEAN)'))
+            conn.execute(db.text("INSERT INTO users (username, email, password_hash) VALUES ('old', 'o@x.io', 'h')"))
+        
+        added = migrations.upgrade(engine)
+        
+        assert added == ['users.last_login_at', 'users.login_count', 'users.deactivated_at',
+                         'users.updated_at', 'users.change_seq']
+        assert migrations.upgrade(engine) == []
+        with engine.connect() as conn:
+            row = conn.execute(db.select(User.__table__).where(User.__table__.c.username == 'old')).mappings().one()
+        assert row['login_count'] == 0
+
+class TestSharding:
+    def test_jump_hash_is_stable_and_minimal(self):
+        """Test growing from 3 to 4 shards only moves keys to the new shard"""
+        before = [jump_hash(k, 3) for k in range(1000)]
+        after = [jump_hash(k, 4) for k in range(1000)]
+        assert before == [jump_hash(k, 3) for k in range(1000)]
+        assert set(before) == {0, 1, 2}
+        moved = [a for b, a in zip(before, after) if a != b]
+        assert moved and set(moved) == {3}
+    
+    def test_users_are_stored_on_their_shard(self, client, sharded):
+        """Test each user row lives only on the shard chosen by its id"""
+        for i in range(6):
+            assert register(client, f'user{i}').status_code == 201
+        
+        counts = sharded.scatter(lambda session: session.query(User.id).all())
+        for shard_id, rows in zip(sharded.shard_ids, counts):
+            assert all(sharded.shard_for(user_id) == shard_id for (user_id,) in rows)
+        assert sum(len(rows) for rows in counts) == 6
+        with app.app_context():
+            assert User.query.count() == 0
+    
+    def test_uniqueness_and_login_use_directory(self, client, sharded):
+        """Test duplicate usernames are rejected across shards and login resolves the shard"""
+        register(client, 'alice')
+        assert register(client, 'alice').status_code == 409
+        
+        response = client.post('/api/users/login',
+                               data=json.dumps({'username': 'alice', 'password': 'TestPass123!'}),
+                               content_type='application/json')
+        assert response.status_code == 200
+        token = json.loads(response.data)['token']
+        
+        response = client.get('/api/users/me', headers={'Authorization': f'Bearer {token}'})
+        assert json.loads(response.data)['user']['username'] == 'alice'
+    
+    def test_list_users_gathers_all_shards(self, client, sharded):
+        """Test list_users merges users from every shard in id order"""
+        for i in range(5):
+            register(client, f'user{i}')
+        token = json.loads(client.post('/api/users/login',
+                                       data=json.dumps({'username': 'user0', 'password': 'TestPass123!'}),
+                                       content_type='application/json').data)['token']
+        
+        response = client.get('/api/users?fields=id,username',
+                              headers={'Authorization': f'Bearer {token}'})
+        data = json.loads(response.data)
+        assert data['total'] == 5
+        assert [u['id'] for u in data['users']] == [1, 2, 3, 4, 5]
+    
+    def test_rebalance_moves_users_to_new_shard(self, client, tmp_path):
+        """Test rebalancing after adding a shard relocates only misplaced users"""
+        urls = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)]
+        app_module.configure_sharding(urls[:2])
+        try:
+            for i in range(20):
+                register(client, f'user{i}')
+            router = ShardRouter(urls)
+            router.create_tables(db.metadata, [User.__table__])
+            
+            moved = router.rebalance(User, batch_size=7, log=lambda message: None)
+            
+            assert moved == sum(1 for user_id in range(1, 21) if router.shard_for(user_id) == 'shard2')
+            rows = router.scatter(lambda session: [u.id for u in session.query(User)])
+            for shard_id, ids in zip(router.shard_ids, rows):
+                assert all(router.shard_for(user_id) == shard_id for user_id in ids)
+            assert sorted(sum(rows, [])) == list(range(1, 21))
+        finally:
+            app_module.configure_sharding([])
+
+    def test_rebalance_command_moves_archived_users(self, client, tmp_path):
+        """Test archived users follow the new placement so the archive fallback finds them"""
+        urls = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)]
+        app_module.configure_sharding(urls[:2])
+        try:
+            for i in range(20):
+                register(client, f'user{i}')
+            session = app_module.shards.session
+            for user in session.query(User).all():
+                user.is_active = False
+                user.deactivated_at = datetime.datetime(2000, 1, 1)
+            session.commit()
+            with app.app_context():
+                assert app_module.archive_users(retention_days=90, batch_size=100) == 20
+            
+            router = app_module.configure_sharding(urls)
+            result = app.test_cli_runner().invoke(args=['shards', 'rebalance'])
+            assert 'Rebalance complete: 0 users and' in result.output
+            
+            rows = router.scatter(lambda session: [u.id for u in session.query(ArchivedUser)])
+            for shard_id, ids in zip(router.shard_ids, rows):
+                assert all(router.shard_for(user_id) == shard_id for user_id in ids)
+            assert sorted(sum(rows, [])) == list(range(1, 21))
+        finally:
+            app_module.configure_sharding([])
+    
+    def test_rebalance_replaces_stale_target_copy(self, client, tmp_path):
+        """Test a leftover target copy from an interrupted run does not win over the source row"""
+        urls = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)]
+        app_module.configure_sharding(urls[:2])
+        try:
+            for i in range(20):
+                register(client, f'user{i}')
+            router = ShardRouter(urls)
+            router.create_tables(db.metadata, [User.__table__])
+            stale_id, newer_id = [i for i in range(1, 21) if router.shard_for(i) == 'shard2'][:2]
+            old = datetime.datetime(2020, 1, 1)
+            
+            copies = []
+            for user_id, name, updated_at in ((stale_id, 'old', old), (newer_id, 'target', datetime.datetime(2100, 1, 1))):
+                source = app_module.shards.engines[app_module.shards.shard_for(user_id)]
+                with source.begin() as conn:
+                    row = dict(conn.execute(User.__table__.select().where(User.__table__.c.id == user_id)).mappings().one())
+                copies.append(dict(row, first_name=name, updated_at=updated_at))
+            with router.engines['shard2'].begin() as conn:
+                conn.execute(User.__table__.insert(), copies)
+            
+            router.rebalance(User, log=lambda message: None)
+            
+            with router.engines['shard2'].connect() as conn:
+                names = dict(conn.execute(db.select(User.__table__.c.id, User.__table__.c.first_name)
+                                          .where(User.__table__.c.id.in_([stale_id, newer_id]))).all())
+            assert names == {stale_id: '', newer_id: 'target'}
+        finally:
+            app_module.configure_sharding([])
+    
+    def test_shard_relays_publish_each_shards_outbox(self, client, sharded):
+        """Test a relay bound to each shard drains that shard's outbox"""
+        for i in range(6):
+            register(client, f'user{i}')
+        redis = FakeRedis()
+        relays = [OutboxRelay(app, db, OutboxEvent, redis, bind=engine) for engine in sharded.engines.values()]
+        
+        assert sum(relay.publish_batch() for relay in relays) == 6
+        assert sorted(int(m[1]['user_id']) for m in redis.messages) == [1, 2, 3, 4, 5, 6]
+        assert sharded.scatter(lambda session: session.query(OutboxEvent).count()) == [0, 0, 0]
+
+class TestArchival:
+    def deactivate(self, client, username, days_ago):
+        register(client, username)
+        with app.app_context():
+            user = User.query.filter_by(username=username).first()
+            user.is_active = False
+            user.deactivated_at = datetime.datetime.utcnow() - datetime.timedelta(days=days_ago)
+            db.session.commit()
+            return user.id
+    
+    def test_archives_only_past_retention(self, client, auth_headers):
+        """Test users deactivated longer than the retention period move to the archive"""
+        old_ids = [self.deactivate(client, f'old{i}', days_ago=120) for i in range(3)]
+        recent_id = self.deactivate(client, 'recent', days_ago=10)
+        
+        with app.app_context():
+            assert app_module.archive_users(retention_days=90, batch_size=2) == 3
+            assert User.query.filter(User.id.in_(old_ids)).count() == 0
+            assert db.session.get(User, recent_id) is not None
+            assert sorted(a.id for a in ArchivedUser.query) == old_ids
+            assert app_module.archive_users(retention_days=90, batch_size=2) == 0
+    
+    def test_get_user_falls_back_to_archive(self, client, auth_headers):
+        """Test get_user still finds an archived user"""
+        user_id = self.deactivate(client, 'archived', days_ago=365)
+        with app.app_context():
+            app_module.archive_users(retention_days=90, batch_size=100)
+        
+        response = client.get(f'/api/users/{user_id}?fields=id,username,is_active', headers=auth_headers)
+        assert response.status_code == 200
+        assert json.loads(response.data)['user'] == {'id': user_id, 'username': 'archived', 'is_active': False}
+    
+    def test_delete_records_deactivation_time(self, client, auth_headers):
+        """Test soft delete stamps deactivated_at"""
+        client.delete('/api/users/1', headers=auth_headers)
+        with app.app_context():
+            assert db.session.get(User, 1).deactivated_at is not None
+
+class TestExport:
+    def test_ndjson_export_with_filters(self, client, auth_headers):
+        """Test NDJSON export streams one object per line and honours is_active"""
+        for i in range(3):
+            register(client, f'user{i}')
+        client.delete('/api/users/1', headers=auth_headers)
+        
+        response = client.get('/api/users/export?is_active=true&fields=id,username', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines == [{'id': i + 2, 'username': f'user{i}'} for i in range(3)]
+        assert 'X-Next-Cursor' not in response.headers
+    
+    def test_cursor_pages_through_csv_export(self, client, auth_headers):
+        """Test X-Next-Cursor resumes the export exactly after the previous page"""
+        for i in range(4):
+            register(client, f'user{i}')
+        
+        ids, url = [], '/api/users/export?format=csv&fields=id,email&page_size=2'
+        while True:
+            response = client.get(url, headers=auth_headers)
+            lines = response.get_data(as_text=True).splitlines()
+            assert lines[0] == 'id,email'
+            ids += [int(line.split(',')[0]) for line in lines[1:]]
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+            url = f'/api/users/export?format=csv&fields=id,email&page_size=2&cursor={cursor}'
+        assert ids == [1, 2, 3, 4, 5]
+    
+    def test_rejects_bad_parameters(self, client, auth_headers):
+        """Test invalid formats, filters and tampered cursors are rejected"""
+        for query in ('format=xml', 'created_after=yesterday', 'cursor=forged'):
+            response = client.get(f'/api/users/export?{query}', headers=auth_headers)
+            assert response.status_code == 400
+    
+    def test_cli_export_prints_resumable_cursor(self, client, auth_headers, tmp_path):
+        """Test the CLI export writes a file and a cursor that continues after it"""
+        runner = app.test_cli_runner()
+        first = tmp_path / 'first.ndjson'
+        result = runner.invoke(args=['users', 'export', '-o', str(first)])
+        assert result.exit_code == 0, result.output
+        assert [json.loads(line)['id'] for line in first.read_text().splitlines()] == [1]
+        
+        register(client, 'later')
+        cursor = result.output.split('Cursor: ')[1].strip()
+        second = tmp_path / 'second.csv'
+        result = runner.invoke(args=['users', 'export', '--format', 'csv', '-o', str(second), '--cursor', cursor])
+        assert result.exit_code == 0, result.output
+        assert second.read_text().splitlines()[1].startswith('2,later,')
+
+class TestImport:
+    def test_cli_imports_and_reports_conflicts(self, client, auth_headers, tmp_path):
+        """Test the import hashes passwords, keeps pre-hashed ones and reports conflicts"""
+        source = tmp_path / 'users.csv'
+        source.write_text(
+            'username,email,password,password_hash,first_name\n'
+            'plain,plain@example.com,Secret123!,,Plain\n'
+            f"hashed,hashed@example.com,,{generate_password_hash('Hashed123!', method='pbkdf2')},Hashed\n"
+            'testuser,other@example.com,Secret123!,,Taken\n'
+            'plain,again@example.com,Secret123!,,Twice\n'
+            'legacy,legacy@example.com,,md5$abc,Legacy\n'
+        )
+        
+        result = app.test_cli_runner().invoke(args=['users', 'import', str(source), '--workers', '0'])
+        assert result.exit_code == 0, result.output
+        assert 'Imported 2 users; 2 conflicts and 1 rejected' in result.output
+        
+        for username, password in (('plain', 'Secret123!'), ('hashed', 'Hashed123!')):
+            response = client.post('/api/users/login',
+                                   data=json.dumps({'username': username, 'password': password}),
+                                   content_type='application/json')
+            assert response.status_code == 200
+        
+        report = (tmp_path / 'users.csv.conflicts.csv').read_text().splitlines()
+        assert report[0] == 'line,username,email,reason'
+        assert sorted(line.split(',')[0] for line in report[1:]) == ['3', '4', '5']
+    
+    def test_non_string_ndjson_values_are_rejected(self, client, tmp_path):
+        """Test a numeric or object password hash goes to the report instead of aborting"""
+        source = tmp_path / 'users.ndjson'
+        source.write_text(''.join(json.dumps(record) + '\n' for record in (
+            {'username': 'numeric', 'email': 'numeric@example.com', 'password_hash': 12345},
+            {'username': 'object', 'email': 'object@example.com', 'password_hash': {'hash': 'x'}},
+            {'username': 'fine', 'email': 'fine@example.com', 'password_hash': 'pbkdf2:sha256:1$salt$hash'},
+        )))
+        
+        result = app.test_cli_runner().invoke(args=['users', 'import', str(source), '--workers', '0'])
+        assert result.exit_code == 0, result.output
+        assert 'Imported 1 users; 0 conflicts and 2 rejected' in result.output
+        report = (tmp_path / 'users.ndjson.conflicts.csv').read_text().splitlines()
+        assert report[1:] == ['1,numeric,numeric@example.com,password_hash must be a string',
+                              '2,object,object@example.com,password_hash must be a string']
+    
+    def test_failed_import_resumes_from_checkpoint(self, client, tmp_path, monkeypatch):
+        """Test a failed chunk is retried on the next run without duplicating earlier chunks"""
+        source = tmp_path / 'users.ndjson'
+        source.write_text(''.join(
+            json.dumps({'username': f'user{i}', 'email': f'user{i}@example.com',
+                        'password_hash': 'pbkdf2:sha256:1$salt$hash'}) + '\n'
+            for i in range(5)
+        ))
+        load, calls = importer.load_generic, []
+        
+        def flaky(session, model, counter, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return load(session, model, counter, rows)
+        
+        monkeypatch.setattr(importer, 'load_generic', flaky)
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                importer.run_import(db.session, User, ChangeCounter, str(source),
+                                    chunk_size=2, workers=0, log=lambda m: None)
+            assert User.query.count() == 2
+            
+            totals = importer.run_import(db.session, User, ChangeCounter, str(source),
+                                         chunk_size=2, workers=0, log=lambda m: None)
+            assert totals['records'] == 5
+            assert totals['inserted'] == 5
+            assert totals['conflicts'] == 0
+            assert User.query.count() == 5
+
+class TestChangeFeed:
+    def changes(self, client, headers, since=None, limit=10):
+        url = f'/api/users/changes?limit={limit}' + (f'&since={since}' if since else '')
+        return json.loads(client.get(url, headers=headers).data)
+    
+    def test_writes_advance_change_sequence(self, client, auth_headers):
+        """Test every write stamps updated_at and a larger change_seq"""
+        with app.app_context():
+            before = db.session.get(User, 1).change_seq
+        client.put('/api/users/1',
+                   data=json.dumps({'first_name': 'Changed'}),
+                   headers=auth_headers,
+                   content_type='application/json')
+        with app.app_context():
+            user = db.session.get(User, 1)
+            assert user.change_seq > before
+            assert user.updated_at is not None
+    
+    def test_feed_pages_through_changes_in_order(self, client, auth_headers):
+        """Test the feed returns changed users once, in change order, with a next cursor"""
+        for i in range(3):
+            register(client, f'user{i}')
+        
+        page = self.changes(client, auth_headers, limit=2)
+        assert [u['username'] for u in page['changes']] == ['testuser', 'user0']
+        assert page['has_more']
+        page = self.changes(client, auth_headers, since=page['next_cursor'], limit=2)
+        assert [u['username'] for u in page['changes']] == ['user1', 'user2']
+        
+        cursor = page['next_cursor']
+        assert self.changes(client, auth_headers, since=cursor)['changes'] == []
+        
+        client.delete('/api/users/1', headers=auth_headers)
+        page = self.changes(client, auth_headers, since=cursor)
+        assert [(u['id'], u['is_active']) for u in page['changes']] == [(1, False)]
+    
+    def test_rejects_bad_cursor(self, client, auth_headers):
+        """Test malformed cursors are rejected"""
+        for since in ('abc', '1.2', '-1'):
+            response = client.get(f'/api/users/changes?since={since}', headers=auth_headers)
+            assert response.status_code == 400
+    
+    def test_sharded_feed_tracks_each_shard(self, client, sharded):
+        """Test the sharded cursor has one position per shard and misses no user"""
+        for i in range(6):
+            register(client, f'user{i}')
+        token = json.loads(client.post('/api/users/login',
+                                       data=json.dumps({'username': 'user0', 'password': 'TestPass123!'}),
+                                       content_type='application/json').data)['token']
+        headers = {'Authorization': f'Bearer {token}'}
+        
+        seen, cursor = [], None
+        while True:
+            page = self.changes(client, headers, since=cursor, limit=4)
+            seen += [u['id'] for u in page['changes']]
+            cursor = page['next_cursor']
+            if not page['has_more']:
+                break
+        assert len(cursor.split('.')) == 3
+        assert sorted(seen) == [1, 2, 3, 4, 5, 6]
+
+class TestBatch:
+    def batch(self, client, headers, items):
+        return client.post('/api/batch', data=json.dumps(items), headers=headers,
+                           content_type='application/json')
+    
+    def test_runs_reads_and_writes_in_order(self, client, auth_headers):
+        """Test sub-requests are dispatched in-process and answered in request order"""
+        register(client, 'other')
+        response = self.batch(client, auth_headers, [
+            {'id': 'me', 'method': 'GET', 'path': '/api/users/me?fields=username'},
+            {'id': 'other', 'method': 'GET', 'path': '/api/users/2?fields=id,username'},
+            {'id': 'rename', 'method': 'PUT', 'path': '/api/users/1', 'body': {'first_name': 'Batched'}},
+            {'id': 'after', 'method': 'GET', 'path': '/api/users/1?fields=first_name'},
+            {'id': 'missing', 'method': 'GET', 'path': '/api/users/99'},
+            {'id': 'nowhere', 'method': 'GET', 'path': '/api/nothing'},
+        ])
+        assert response.status_code == 200
+        results = json.loads(response.data)['responses']
+        assert [r['id'] for r in results] == ['me', 'other', 'rename', 'after', 'missing', 'nowhere']
+        assert [r['status'] for r in results] == [200, 200, 200, 200, 404, 404]
+        assert results[0]['body'] == {'user': {'username': 'testuser'}}
+        assert results[1]['body'] == {'user': {'id': 2, 'username': 'other'}}
+        assert results[3]['body'] == {'user': {'first_name': 'Batched'}}
+    
+    def test_sub_requests_act_as_batch_user(self, client, auth_headers):
+        """Test authorization checks in sub-requests apply to the authenticated user"""
+        register(client, 'other')
+        results = json.loads(self.batch(client, auth_headers, [
+            {'method': 'DELETE', 'path': '/api/users/2'},
+        ]).data)['responses']
+        assert results == [{'id': 0, 'status': 403, 'body': {'message': 'Unauthorized'}}]
+    
+    def test_limits(self, client, auth_headers):
+        """Test oversized, malformed and excluded batches are rejected"""
+        too_many = [{'path': '/api/users/me'}] * (app.config['BATCH_MAX_ITEMS'] + 1)
+        assert self.batch(client, auth_headers, too_many).status_code == 400
+        assert self.batch(client, auth_headers, {'path': '/api/users/me'}).status_code == 400
+        assert self.batch(client, auth_headers, [{'path': 'api/users/me'}]).status_code == 400
+        writes = [{'method': 'PUT', 'path': '/api/users/1', 'body': {}}] * (app.config['BATCH_MAX_WRITES'] + 1)
+        assert self.batch(client, auth_headers, writes).status_code == 400
+        
+        nested = json.loads(self.batch(client, auth_headers, [
+            {'method': 'POST', 'path': '/api/batch', 'body': []},
+        ]).data)['responses']
+        assert nested[0]['status'] == 400
+    
+    def test_sub_requests_run_request_hooks(self, client, auth_headers, monkeypatch, caplog):
+        """Test sub-requests get their route's deadline and their own access-log record"""
+        monkeypatch.setitem(app.config, 'REQUEST_TIMEOUTS', {'update_user': 1e-6})
+        with caplog.at_level(logging.INFO, logger='access'):
+            results = json.loads(self.batch(client, auth_headers, [
+                {'method': 'GET', 'path': '/api/users/me'},
+                {'method': 'PUT', 'path': '/api/users/1', 'body': {'first_name': 'Late'}},
+            ]).data)['responses']
+        assert [r['status'] for r in results] == [200, 504]
+        
+        logged = [(r.fields['route'], r.fields['status'], r.fields['user_id'])
+                  for r in caplog.records if r.name == 'access']
+        assert ('/api/users/me', 200, 1) in logged
+        assert ('/api/users/<int:user_id>', 504, 1) in logged
+        assert ('/api/batch', 200, 1) in logged
+    
+    def test_time_budget_skips_remaining_items(self, client, auth_headers, monkeypatch):
+        """Test items not started within the time budget get 503"""
+        monkeypatch.setitem(app.config, 'BATCH_TIME_BUDGET', -1)
+        results = json.loads(self.batch(client, auth_headers, [{'path': '/api/users/me'}]).data)['responses']
+        assert results[0]['status'] == 503
+    
+    def test_requires_authentication(self, client):
+        """Test the batch itself needs a token"""
+        assert self.batch(client, {}, [{'path': '/api/users/me'}]).status_code == 401
+
+class TestRequestSchemas:
+    def post(self, client, path, body):
+        return client.post(path, data=body, content_type='application/json')
+    
+    def test_null_and_malformed_bodies_are_400(self, client):
+        """Test null, empty and malformed bodies get 400 instead of an error"""
+        for path in ('/api/users/register', '/api/users/login'):
+            for body in ('null', '', '{"username": ', '[]'):
+                response = self.post(client, path, body)
+                assert response.status_code == 400, (path, body)
+    
+    def test_type_and_length_errors_name_the_field(self, client):
+        """Test validation errors point at the offending field"""
+        response = self.post(client, '/api/users/register', json.dumps(
+            {'username': 'x', 'email': 'x@example.com', 'password': 123}))
+        assert response.status_code == 400
+        assert '$.password' in json.loads(response.data)['error']
+        
+        response = self.post(client, '/api/users/register', json.dumps(
+            {'username': 'x' * 81, 'email': 'x@example.com', 'password': 'Pass123!'}))
+        assert '$.username' in json.loads(response.data)['error']
+        
+        response = self.post(client, '/api/users/register', json.dumps(
+            {'username': 'x', 'email': 'not-an-email', 'password': 'Pass123!'}))
+        assert '$.email' in json.loads(response.data)['error']
+    
+    def test_oversized_body_is_413(self, client):
+        """Test bodies above MAX_BODY_BYTES are rejected before decoding"""
+        body = json.dumps({'username': 'x', 'password': 'p' * app.config['MAX_BODY_BYTES']})
+        assert self.post(client, '/api/users/login', body).status_code == 413
+    
+    def test_update_rejects_null_fields(self, client, auth_headers):
+        """Test update only applies fields that are present and valid"""
+        response = client.put('/api/users/1', data=json.dumps({'email': None}),
+                              headers=auth_headers, content_type='application/json')
+        assert response.status_code == 400
+        
+        response = client.put('/api/users/1', data=json.dumps({'last_name': 'Only'}),
+                              headers=auth_headers, content_type='application/json')
+        user = json.loads(response.data)['user']
+        assert (user['first_name'], user['last_name'], user['email']) == ('Test', 'Only', 'test@example.com')
+
+class DictRedis:
+    """Just enough of redis-py for RedisStore and UserLookup"""
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+    
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def delete(self, key):
+        self.data.pop(key, None)
+
+class TestIdempotency:
+    def register(self, client, key, username='retried'):
+        return client.post('/api/users/register',
+                           data=json.dumps({'username': username, 'email': 'retried@example.com',
+                                            'password': 'TestPass123!'}),
+                           headers={'Idempotency-Key': key},
+                           content_type='application/json')
+    
+    def test_retry_replays_first_response(self, client):
+        """Test a retried register returns the stored 201 instead of a 409"""
+        first = self.register(client, 'key-1')
+        retry = self.register(client, 'key-1')
+        
+        assert first.status_code == retry.status_code == 201
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert json.loads(retry.data) == json.loads(first.data)
+        assert self.register(client, 'key-2').status_code == 409
+        with app.app_context():
+            assert User.query.count() == 1
+    
+    def test_key_reuse_with_other_body_is_rejected(self, client):
+        """Test a key cannot be replayed for a different request body"""
+        self.register(client, 'key-1')
+        assert self.register(client, 'key-1', username='someone-else').status_code == 422
+    
+    def test_oversized_body_is_rejected_before_claiming(self, client, monkeypatch):
+        """Test a body above the limit gets 413 without being hashed or claiming the key"""
+        monkeypatch.setattr(app_module.idempotent, 'max_bytes', 64)
+        response = client.post('/api/users/register', data=json.dumps({'username': 'x' * 100}),
+                               headers={'Idempotency-Key': 'big'}, content_type='application/json')
+        assert response.status_code == 413
+        with app.app_context():
+            assert db.session.query(app_module.IdempotencyKey).count() == 0
+    
+    def test_keys_are_scoped_to_user_and_route(self, client, auth_headers):
+        """Test the same key on another route is a separate request"""
+        headers = dict(auth_headers, **{'Idempotency-Key': 'shared'})
+        update = client.put('/api/users/1', data=json.dumps({'first_name': 'Once'}),
+                            headers=headers, content_type='application/json')
+        delete = client.delete('/api/users/1', headers=headers)
+        assert update.status_code == delete.status_code == 200
+        assert 'Idempotent-Replayed' not in delete.headers
+    
+    def test_concurrent_duplicate_waits_for_original(self):
+        """Test a duplicate arriving mid-flight waits and replays instead of running again"""
+        idempotent = Idempotency(RedisStore(DictRedis()), poll_interval=0.01)
+        started, release, calls = threading.Event(), threading.Event(), []
+        
+        @idempotent
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'created': True}, 201
+        
+        def call(results):
+            with app.test_request_context('/slow', method='POST', data='{}',
+                                          headers={'Idempotency-Key': 'k'}):
+                results.append(slow())
+        
+        first = []
+        thread = threading.Thread(target=call, args=(first,))
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        second = []
+        call(second)
+        thread.join()
+        
+        assert calls == [1]
+        assert second[0].status_code == 201
+        assert second[0].headers['Idempotent-Replayed'] == 'true'
+    
+    def test_server_error_releases_key(self):
+        """Test a 5xx is not stored, so the retry runs again"""
+        idempotent = Idempotency(RedisStore(DictRedis()))
+        statuses = iter([503, 201])
+        
+        @idempotent
+        def flaky():
+            return {}, next(statuses)
+        
+        for expected in (503, 201):
+            with app.test_request_context('/flaky', method='POST', headers={'Idempotency-Key': 'k'}):
+                assert flaky().status_code == expected
+
+class TestCircuitBreaker:
+    def test_opens_on_failure_rate(self):
+        """Test the circuit opens once enough statements fail"""
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4)
+        for failed in (False, True, False):
+            breaker.record(failed, 0.01)
+        assert breaker.state == 'closed'
+        
+        breaker.record(True, 0.01)
+        assert breaker.state == 'open'
+        assert not breaker.allow()
+    
+    def test_opens_on_slow_calls(self):
+        """Test slow statements alone can open the circuit"""
+        breaker = CircuitBreaker(slow_call_seconds=1.0, slow_call_rate=0.5, min_calls=2)
+        breaker.record(False, 1.5)
+        breaker.record(False, 2.0)
+        
+        assert breaker.state == 'open'
+    
+    def test_window_counts_match_after_many_calls(self, monkeypatch):
+        """Test the running failure and slow counts track the rolling window exactly"""
+        import breaker as breaker_module
+        clock = [0.0]
+        monkeypatch.setattr(breaker_module.time, 'monotonic', lambda: clock[0])
+        breaker = CircuitBreaker(failure_rate=0.9, slow_call_seconds=1.0, slow_call_rate=0.9,
+                                 min_calls=10, window_seconds=30.0)
+        calls = []
+        for i in range(20000):
+            clock[0] = i * 0.01
+            failed, duration = i % 7 == 0, 2.0 if i % 5 == 0 else 0.01
+            breaker.record(failed, duration)
+            calls.append((clock[0], failed, duration >= 1.0))
+        
+        window = [c for c in calls if clock[0] - c[0] <= 30.0]
+        assert breaker.state == 'closed'
+        assert breaker.counts() == (len(window), sum(c[1] for c in window), sum(c[2] for c in window))
+    
+    def test_half_open_probe_closes_or_reopens(self):
+        """Test one probe is let through after the cooldown"""
+        breaker = CircuitBreaker(open_seconds=0, probe_interval=60)
+        breaker.trip()
+        
+        assert breaker.allow()
+        assert breaker.state == 'half-open'
+        assert not breaker.allow()
+        breaker.record(True, 0.01)
+        assert breaker.state == 'open'
+        
+        breaker._last_probe = 0.0
+        assert breaker.allow()
+        breaker.record(False, 0.01)
+        assert breaker.state == 'closed'
+    
+    def test_stale_cache_is_bounded(self):
+        """Test the stale copy evicts least recently stored users"""
+        cache = StaleUserCache(max_entries=2)
+        for user_id in (1, 2, 3):
+            cache.put({'id': user_id})
+        
+        assert cache.get(1) is None
+        assert cache.get(3)[0] == {'id': 3}
+    
+    def test_open_circuit_serves_stale_reads_and_rejects_writes(self, client, auth_headers):
+        """Test reads fall back to the stale copy with Warning/Age while writes get 503"""
+        app_module.stale_users.clear()
+        me = json.loads(client.get('/api/users/me', headers=auth_headers).data)['user']
+        app_module.breaker.trip()
+        try:
+            response = client.get('/api/users/me', headers=auth_headers)
+            assert response.status_code == 200
+            assert json.loads(response.data)['user'] == me
+            assert response.headers['Warning'] == '110 - "Response is Stale"'
+            assert int(response.headers['Age']) >= 0
+            
+            assert client.get(f"/api/users/{me['id']}?fields=id,username", headers=auth_headers).status_code == 200
+            assert client.get(f"/api/users/{me['id'] + 1}", headers=auth_headers).status_code == 503
+            assert client.get('/api/users', headers=auth_headers).status_code == 503
+            
+            response = client.put(f"/api/users/{me['id']}", headers=auth_headers, json={'first_name': 'X'})
+            assert response.status_code == 503
+            assert 'Retry-After' in response.headers
+            assert client.get('/health').status_code == 200
+        finally:
+            app_module.breaker.reset()
+            app_module.stale_users.clear()
+
+class TestDeadlines:
+    def test_client_header_is_capped_by_route_policy(self, client):
+        """Test the client may shorten but not extend the route's budget"""
+        with app.test_request_context('/api/users', headers={deadlines.HEADER: '999'}):
+            deadlines.start(10.0, {'list_users': 5.0}, 'list_users', '999')
+            assert 4.0 < deadlines.remaining() <= 5.0
+            deadlines.start(10.0, {'list_users': 5.0}, 'list_users', '0.5')
+            assert deadlines.remaining() <= 0.5
+        
+        assert deadlines.parse_policy('list_users=5, export_users=300') == {'list_users': 5.0, 'export_users': 300.0}
+    
+    def test_rejects_invalid_header(self, client):
+        """Test a malformed or non-positive timeout header is a 400"""
+        for value in ('soon', '0'):
+            response = client.get('/health', headers={deadlines.HEADER: value})
+            assert response.status_code == 400
+    
+    def test_skips_password_hashing_without_budget(self, client):
+        """Test register gives up with 504 instead of hashing past the deadline"""
+        response = client.post('/api/users/register', headers={deadlines.HEADER: '0.01'},
+                               json={'username': 'late', 'email': 'late@example.com', 'password': 'pw'})
+        
+        assert response.status_code == 504
+        with app.app_context():
+            assert User.query.filter_by(username='late').first() is None
+    
+    def test_postgres_transactions_get_remaining_budget(self):
+        """Test each transaction sets statement_timeout/lock_timeout to the time left"""
+        class Connection:
+            class dialect:
+                name = 'postgresql'
+            def __init__(self):
+                self.executed = []
+            def execute(self, statement, params):
+                self.executed.append(params)
+        
+        connection = Connection()
+        with app.test_request_context('/'):
+            deadlines.set_database_timeouts(None, None, connection)
+            deadlines.start(2.0, {}, 'list_users')
+            deadlines.set_database_timeouts(None, None, connection)
+            assert 1000 < int(connection.executed[0]['ms']) <= 2000
+            
+            deadlines.start(0.0001, {}, 'list_users')
+            time.sleep(0.001)
+            with pytest.raises(deadlines.DeadlineExceeded):
+                deadlines.set_database_timeouts(None, None, connection)
+        assert len(connection.executed) == 1
+
+class TestLogging:
+    def test_access_log_records_request(self, client, auth_headers, caplog):
+        """Test each request gets an access record with route, status, user and DB time"""
+        with caplog.at_level(logging.INFO, logger='access'):
+            client.get('/api/users/me', headers=auth_headers)
+        
+        fields = [r for r in caplog.records if r.name == 'access'][-1].fields
+        assert fields['route'] == '/api/users/me'
+        assert fields['status'] == 200
+        assert fields['user_id'] is not None
+        assert fields['duration_ms'] >= fields['db_ms'] > 0
+    
+    def test_samples_only_successful_requests(self, client, caplog, monkeypatch):
+        """Test 2xx responses are sampled per endpoint while errors are always logged"""
+        monkeypatch.setattr(app_module.access_log, 'endpoint_rates', {'health': 0, 'get_user': 0})
+        with caplog.at_level(logging.INFO, logger='access'):
+            client.get('/health')
+            client.get('/api/users/1')
+        
+        statuses = [r.fields['status'] for r in caplog.records if r.name == 'access']
+        assert statuses == [401]
+    
+    def test_test_suite_discards_log_output(self, client, capsys):
+        """Test the suite runs with LOG_OUTPUT=none so requests write nothing to stdout"""
+        assert app.config['LOG_OUTPUT'] == 'none'
+        client.get('/health')
+        app_module.log_listener.stop()
+        app_module.log_listener.start()
+        assert capsys.readouterr().out == ''
+        with pytest.raises(ValueError):
+            logs.configure(output='file')
+    
+    def test_full_queue_drops_and_reports(self):
+        """Test a full queue drops records instead of blocking and reports the loss"""
+        handler = logs.DroppingQueueHandler(maxsize=1)
+        logger = logging.getLogger('test.dropping')
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            for i in range(3):
+                logger.warning('message %d', i)
+            assert handler.dropped == 2
+            
+            assert handler.queue.get_nowait().getMessage() == 'message 0'
+            logger.warning('after')
+            notice = handler.queue.get_nowait()
+            assert notice.fields == {'dropped': 2, 'dropped_total': 2}
+        finally:
+            logger.removeHandler(handler)
+    
+    def test_json_formatter(self):
+        """Test records format as one JSON object with their fields and exception"""
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            record = logging.getLogger('test').makeRecord('test', logging.ERROR, __file__, 1, 'failed %s', ('x',),
+                                                          sys.exc_info(), extra={'fields': {'user_id': 7}})
+        entry = json.loads(logs.JsonFormatter().format(logs.DroppingQueueHandler(1).prepare(record)))
+        
+        assert entry['message'] == 'failed x'
+        assert entry['level'] == 'ERROR'
+        assert entry['user_id'] == 7
+        assert 'RuntimeError: boom' in entry['exception']
+
+class TestUserLookupCoalescing:
+    def test_concurrent_lookups_share_one_load(self):
+        """Test callers arriving while a load is in flight wait for its result"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return {'id': 7}
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do(7, load))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        assert len(calls) == 1
+        assert results == [{'id': 7}] * 5
+    
+    def test_missing_ids_are_cached_briefly(self):
+        """Test unknown ids are not reloaded until invalidated or expired"""
+        loads = []
+        lookup = UserLookup(lambda user_id: loads.append(user_id), negative_ttl=60)
+        
+        assert lookup.get(404) is None
+        assert lookup.get(404) is None
+        assert loads == [404]
+        
+        lookup.invalidate(404)
+        lookup.get(404)
+        assert loads == [404, 404]
+    
+    def test_one_worker_refills_shared_cache(self):
+        """Test with Redis a miss is loaded once and other workers read the refill"""
+        redis = DictRedis()
+        loads = []
+        
+        def load(user_id):
+            loads.append(user_id)
+            return {'user': {'id': user_id}, 'archived': False}
+        
+        first, second = UserLookup(load, redis), UserLookup(load, redis, poll_interval=0.01)
+        assert first.get(1) == {'user': {'id': 1}, 'archived': False}
+        assert second.get(1) == first.get(1)
+        assert loads == [1]
+        
+        # A refill already in progress elsewhere: wait for it instead of loading
+        redis.set('user-cache:2:lock', '1')
+        threading.Timer(0.05, lambda: redis.set('user-cache:2', json.dumps({'user': {'id': 2}, 'archived': False}))).start()
+        assert second.get(2)['user'] == {'id': 2}
+        assert loads == [1]
+    
+    def test_miss_cleared_by_another_worker(self):
+        """Test with Redis a miss invalidated by one worker is not remembered by another"""
+        redis = DictRedis()
+        users = {}
+        load = lambda user_id: users.get(user_id)
+        first, second = UserLookup(load, redis, negative_ttl=60), UserLookup(load, redis, negative_ttl=60)
+        
+        assert first.get(3) is None
+        users[3] = {'user': {'id': 3}, 'archived': False}
+        second.invalidate(3)
+        
+        assert first.get(3) == users[3]
+    
+    def test_archival_invalidates_cached_users(self, client, auth_headers, monkeypatch):
+        """Test archived users are dropped from the lookup cache"""
+        invalidated = []
+        monkeypatch.setattr(app_module.user_lookup, 'invalidate', invalidated.append)
+        client.delete('/api/users/1', headers=auth_headers)
+        with app.app_context():
+            user = db.session.get(User, 1)
+            user.deactivated_at = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+            db.session.commit()
+            invalidated.clear()
+            assert app_module.archive_users(retention_days=90, batch_size=100) == 1
+        
+        assert invalidated == [1]
+    
+    def test_cleanup_invalidates_deleted_users(self, client, auth_headers, monkeypatch):
+        """Test the cleanup endpoint drops every deleted user from the shared cache"""
+        register(client, 'second')
+        redis = DictRedis()
+        lookup = UserLookup(app_module.load_user_entry, redis)
+        monkeypatch.setattr(app_module, 'user_lookup', lookup)
+        assert client.get('/api/users/2', headers=auth_headers).status_code == 200
+        assert 'user-cache:1' in redis.data and 'user-cache:2' in redis.data
+        
+        assert client.delete('/api/test/cleanup').status_code == 200
+        assert not [key for key in redis.data if key.startswith('user-cache:')]
+        assert client.get('/api/users/me', headers=auth_headers).status_code == 401
+    
+    def test_registration_clears_cached_miss(self, client, auth_headers):
+        """Test a user registered after their id was looked up is found"""
+        assert client.get('/api/users/2', headers=auth_headers).status_code == 404
+        assert register(client, 'second').status_code == 201
+        
+        response = client.get('/api/users/2?fields=id,username', headers=auth_headers)
+        assert response.status_code == 200
+        assert json.loads(response.data)['user'] == {'id': 2, 'username': 'second'}
+
 # Pytest configuration for coverage
 if __name__ == '__main__':
     pytest.main(['-v', '--cov=app', '--cov-report=html', '--cov-report=term'])